@@ -0,0 +1,393 @@
+"""
+Benchmark de los endpoints REST.
+
+Siembra una base de datos (SQLite temporal por defecto, o la que se pase con
+--database-url, p.ej. Postgres) con el volumen pedido de User, People, Planets y
+favoritos, recorre cada ruta con el test client de Flask o contra un proceso
+real de gunicorn, y escribe throughput, p50/p95/p99 y queries por request en
+JSON para poder comparar entre commits:
+
+    pipenv run bench --people 50000 --planets 5000 --output before.json
+    pipenv run bench --people 50000 --planets 5000 --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+SEED_CHUNK = 5000
+# items por request en los endpoints /bulk
+BULK_ITEMS = 20
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Base de datos a sembrar (por defecto un SQLite temporal)')
+    parser.add_argument('--reset', action='store_true', help='Borra y recrea las tablas antes de sembrar')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--people', type=int, default=10000)
+    parser.add_argument('--planets', type=int, default=1000)
+    parser.add_argument('--favorites', type=int, default=20, help='Favoritos de cada tipo por usuario')
+    parser.add_argument('--requests', type=int, default=200, help='Requests por endpoint')
+    parser.add_argument('--mode', choices=('client', 'gunicorn'), default='client')
+    parser.add_argument('--workers', type=int, default=1, help='Workers de gunicorn')
+    parser.add_argument('--concurrency', type=int, default=4, help='Clientes concurrentes en modo gunicorn')
+    parser.add_argument('--cache', default='none', help='CACHE_URL para la app (none, memory, redis://...)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='JSON de una corrida anterior para mostrar la diferencia')
+    return parser.parse_args()
+
+def configure_env(args):
+    # la app lee la configuracion al importarse, hay que fijarla antes
+    if args.database_url is None:
+        args.database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        args.reset = True
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['CACHE_URL'] = args.cache
+    # el benchmark manda todo desde una IP, sin limite de peticiones
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    # la replica no tendria los datos sembrados: todo se lee de la base del benchmark
+    os.environ.pop('DATABASE_READ_URL', None)
+    sys.path.insert(0, SRC)
+
+def doomed_count(args):
+    # filas que solo existen para que las borren los DELETE: una por request y BULK_ITEMS por request de /bulk
+    return args.requests * (1 + BULK_ITEMS)
+
+def seed(args):
+    from app import create_app
+    from models import db, User, People, Planets, Favorites_People, Favorites_Planets
+    from counters import reconcile_favorites_counts
+    from jobs import claim_job, enqueue, run_job
+    app = create_app()
+    rng = random.Random(args.seed)
+    doomed = doomed_count(args)
+    with app.app_context():
+        if args.reset:
+            db.drop_all(bind_key=None)
+            db.create_all(bind_key=None)
+        elif db.session.query(People.id).first() is not None:
+            raise SystemExit('La base de datos ya tiene datos, usa --reset para sembrarla de nuevo')
+        inserts = [
+            (User, [{'name': 'user{}'.format(i), 'email': 'user{}@bench.dev'.format(i), 'password': 'x',
+                     'is_active': True} for i in range(args.users)]),
+            (People, [{'name': 'person{}'.format(i), 'height': rng.randint(60, 250), 'mass': rng.randint(20, 200),
+                       'hair_color': rng.choice(('black', 'brown', 'blond', 'red', 'none'))}
+                      for i in range(args.people)]),
+            (Planets, [{'name': 'planet{}'.format(i), 'diameter': rng.randint(1000, 200000),
+                        'rotation_period': rng.randint(5, 100)} for i in range(args.planets)]),
+        ]
+        favorites_planets = set()
+        favorites_people = set()
+        for user_id in range(1, args.users + 1):
+            for _ in range(args.favorites):
+                favorites_planets.add((user_id, rng.randint(1, args.planets)))
+                favorites_people.add((user_id, rng.randint(1, args.people)))
+        # despues de las normales y sin usar rng, asi los datos que se leen no cambian entre corridas
+        inserts[0][1].extend({'name': 'doomed{}'.format(i), 'email': 'doomed{}@bench.dev'.format(i),
+                              'password': 'x', 'is_active': True} for i in range(doomed))
+        inserts[1][1].extend({'name': 'doomed{}'.format(i), 'height': 1, 'mass': 1, 'hair_color': 'none'}
+                             for i in range(doomed))
+        inserts[2][1].extend({'name': 'doomed{}'.format(i), 'diameter': 1, 'rotation_period': 1}
+                             for i in range(doomed))
+        # un favorito de cada tipo por usuario condenado, para los DELETE de favoritos
+        doomed_favorites = [(args.users + 1 + i, 1 + i % args.planets, 1 + i % args.people) for i in range(doomed)]
+        inserts.append((Favorites_Planets, [{'user_id': u, 'planet_id': p} for u, p in sorted(favorites_planets)] +
+                        [{'user_id': u, 'planet_id': p} for u, p, _ in doomed_favorites]))
+        inserts.append((Favorites_People, [{'user_id': u, 'people_id': p} for u, p in sorted(favorites_people)] +
+                        [{'user_id': u, 'people_id': p} for u, _, p in doomed_favorites]))
+        # las tablas estan vacias, los ids salen en orden de insercion
+        args.doomed = {'user': args.users + 1, 'people': args.people + 1, 'planets': args.planets + 1,
+                       'favorites_planets': len(favorites_planets) + 1,
+                       'favorites_people': len(favorites_people) + 1}
+        for model, rows in inserts:
+            for start in range(0, len(rows), SEED_CHUNK):
+                db.session.bulk_insert_mappings(model, rows[start:start + SEED_CHUNK])
+                db.session.commit()
+        # los favoritos se insertan por fuera de la API, los contadores se calculan al final
+        reconcile_favorites_counts(db.session)
+        db.session.commit()
+        # un export terminado para GET /jobs/<id> y su descarga; el worker no se mide
+        enqueue('export', {'table': 'planets'})
+        job = claim_job('bench')
+        run_job(job)
+        args.job = job.id
+    return app
+
+def endpoints(args):
+    """
+    Lista de (nombre, metodo, url, body). {user}, {people} y {planet} se cambian por ids aleatorios validos,
+    {people_ids} por 20 ids de people separados por coma, {job} por el export sembrado y {doomed_<tabla>} por
+    una fila distinta en cada request. body puede ser una funcion (rng, args, n) del numero de request.
+    Los DELETE van al final, despues de los GET y escrituras que leen esas tablas.
+    """
+    return [
+        ('GET /user', 'GET', '/user', None),
+        ('GET /user/<id>', 'GET', '/user/{user}', None),
+        ('GET /people', 'GET', '/people', None),
+        ('GET /people?limit=1000', 'GET', '/people?limit=1000', None),
+        ('GET /people?fields=name', 'GET', '/people?fields=name&limit=1000', None),
+        ('GET /people?filter+sort', 'GET', '/people?hair_color=brown&height__gte=150&sort=-mass', None),
+        ('GET /people/<id>', 'GET', '/people/{people}', None),
+        ('GET /people?ids=<20 ids>', 'GET', '/people?ids={people_ids}', None),
+        ('GET /planets', 'GET', '/planets', None),
+        ('GET /planets/<id>', 'GET', '/planets/{planet}', None),
+        ('GET /planets/top', 'GET', '/planets/top?limit=20', None),
+        ('GET /user/<id>/favorites', 'GET', '/user/{user}/favorites', None),
+        ('GET /export/planets', 'GET', '/export/planets', None),
+        ('GET /jobs/<id>', 'GET', '/jobs/{job}', None),
+        ('GET /jobs/<id>/download', 'GET', '/jobs/{job}/download', None),
+        ('POST /user', 'POST', '/user', lambda rng, args, n: {'name': 'bench', 'email': 'bench{}@bench.dev'.format(n),
+                                                              'password': 'x'}),
+        ('PUT /user/<id>', 'PUT', '/user/{user}', {'name': 'bench'}),
+        ('POST /people', 'POST', '/people', {'name': 'bench', 'height': 1, 'mass': 1, 'hair_color': 'x'}),
+        ('PUT /people/<id>', 'PUT', '/people/{people}', {'mass': 99}),
+        ('POST /planets', 'POST', '/planets', lambda rng, args, n: {'name': 'bench{}'.format(n), 'diameter': 1,
+                                                                    'rotation_period': 1}),
+        ('PUT /planets/<id>', 'PUT', '/planets/{planet}', {'diameter': 99}),
+        ('POST /favorites_planets/<id>', 'POST', '/favorites_planets/{user}', {'planet_id': 1}),
+        ('POST /favorites_people/<id>', 'POST', '/favorites_people/{user}', {'people_id': 1}),
+        ('POST /user/bulk', 'POST', '/user/bulk', lambda rng, args, n: [
+            {'name': 'bulk', 'email': 'bulk{}.{}@bench.dev'.format(n, i), 'password': 'x'} for i in range(BULK_ITEMS)]),
+        ('POST /people/bulk', 'POST', '/people/bulk', lambda rng, args, n: [
+            {'name': 'bulk', 'height': 1, 'mass': 1} for _ in range(BULK_ITEMS // 2)] + [
+            {'id': rng.randint(1, args.people), 'mass': 99} for _ in range(BULK_ITEMS // 2)]),
+        ('POST /planets/bulk', 'POST', '/planets/bulk', lambda rng, args, n: [
+            {'name': 'bulk{}.{}'.format(n, i), 'diameter': 1} for i in range(BULK_ITEMS // 2)] + [
+            {'id': rng.randint(1, args.planets), 'diameter': 99} for _ in range(BULK_ITEMS // 2)]),
+        ('POST /favorites_planets/bulk', 'POST', '/favorites_planets/bulk', lambda rng, args, n: [
+            {'user_id': rng.randint(1, args.users), 'planet_id': rng.randint(1, args.planets)}
+            for _ in range(BULK_ITEMS)]),
+        ('POST /favorites_people/bulk', 'POST', '/favorites_people/bulk', lambda rng, args, n: [
+            {'user_id': rng.randint(1, args.users), 'people_id': rng.randint(1, args.people)}
+            for _ in range(BULK_ITEMS)]),
+        ('POST /jobs', 'POST', '/jobs', {'kind': 'export', 'payload': {'table': 'planets'}}),
+        ('DELETE /favorites_planets/<id>', 'DELETE', '/favorites_planets/{doomed_favorites_planets}', None),
+        ('DELETE /favorites_people/<id>', 'DELETE', '/favorites_people/{doomed_favorites_people}', None),
+        ('DELETE /favorites_planets/bulk', 'DELETE', '/favorites_planets/bulk', doomed_bulk('favorites_planets')),
+        ('DELETE /favorites_people/bulk', 'DELETE', '/favorites_people/bulk', doomed_bulk('favorites_people')),
+        ('DELETE /people/<id>', 'DELETE', '/people/{doomed_people}', None),
+        ('DELETE /planets/<id>', 'DELETE', '/planets/{doomed_planets}', None),
+        ('DELETE /user/<id>', 'DELETE', '/user/{doomed_user}', None),
+        ('DELETE /people/bulk', 'DELETE', '/people/bulk', doomed_bulk('people')),
+        ('DELETE /planets/bulk', 'DELETE', '/planets/bulk', doomed_bulk('planets')),
+        ('DELETE /user/bulk', 'DELETE', '/user/bulk', doomed_bulk('user')),
+    ]
+
+def doomed_bulk(table):
+    # los DELETE de a uno usan las primeras args.requests filas condenadas, cada request bulk las BULK_ITEMS siguientes
+    def body(rng, args, n):
+        start = args.doomed[table] + args.requests + n * BULK_ITEMS
+        return list(range(start, start + BULK_ITEMS))
+    return body
+
+def fill(url, body, rng, args, n):
+    """url y body de la request numero n de un endpoint."""
+    values = dict(('doomed_' + table, first + n) for table, first in args.doomed.items())
+    url = url.format(user=rng.randint(1, args.users), people=rng.randint(1, args.people),
+                     planet=rng.randint(1, args.planets), job=args.job,
+                     people_ids=','.join(str(rng.randint(1, args.people)) for _ in range(20)), **values)
+    if callable(body):
+        body = body(rng, args, n)
+    return url, body
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies, errors, elapsed, queries):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'queries_per_request': queries,
+    }
+
+def run_client(app, args):
+    from sqlalchemy import event
+    from models import db
+    counter = [0]
+
+    def count(*_):
+        counter[0] += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    results = {}
+    for name, method, url, body in endpoints(args):
+        latencies, errors = [], 0
+        counter[0] = 0
+        started = time.perf_counter()
+        for n in range(args.requests):
+            path, data = fill(url, body, rng, args, n)
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=data)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+        results[name] = summarize(latencies, errors, elapsed, round(counter[0] / float(args.requests), 2))
+        print_result(name, results[name])
+    return results
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def http(base, method, url, body):
+    data = None if body is None else json.dumps(body).encode('utf-8')
+    req = urllib.request.Request(base + url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+def scrape_queries(base):
+    # media de queries por ruta desde /metrics (solo es exacto con un worker)
+    with urllib.request.urlopen(base + '/metrics') as response:
+        text = response.read().decode('utf-8')
+    sums, counts = {}, {}
+    for line in text.splitlines():
+        for suffix, target in (('_sum', sums), ('_count', counts)):
+            prefix = 'db_queries_per_request' + suffix + '{'
+            if line.startswith(prefix):
+                labels, value = line[len(prefix):].rsplit('} ', 1)
+                key = tuple(part.split('=', 1)[1].strip('"') for part in labels.split(',')[:2])
+                target[key] = target.get(key, 0) + float(value)
+    return sums, counts
+
+def run_gunicorn(args):
+    port = free_port()
+    base = 'http://127.0.0.1:{}'.format(port)
+    command = ['gunicorn', 'wsgi', '--chdir', SRC, '--bind', '127.0.0.1:{}'.format(port),
+               '--workers', str(args.workers), '--threads', str(args.concurrency), '--log-level', 'warning']
+    server = subprocess.Popen(command, env=os.environ.copy())
+    try:
+        for _ in range(100):
+            try:
+                http(base, 'GET', '/metrics', None)
+                break
+            except urllib.error.URLError:
+                time.sleep(0.1)
+        else:
+            raise SystemExit('gunicorn no arranco')
+        rng = random.Random(args.seed)
+        results = {}
+        for name, method, url, body in endpoints(args):
+            before = scrape_queries(base)
+            requests = [fill(url, body, rng, args, n) for n in range(args.requests)]
+            latencies, errors = [], [0]
+            lock = threading.Lock()
+
+            def worker(chunk):
+                for path, data in chunk:
+                    start = time.perf_counter()
+                    status = http(base, method, path, data)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        if status >= 400:
+                            errors[0] += 1
+
+            threads = [threading.Thread(target=worker, args=(requests[i::args.concurrency],))
+                       for i in range(args.concurrency)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            queries = None
+            if args.workers == 1:
+                after = scrape_queries(base)
+                # entre dos lecturas de /metrics solo corrio este endpoint
+                keys = [key for key in after[1] if key[1] != '/metrics']
+                total = sum(after[0][key] - before[0].get(key, 0) for key in keys)
+                count = sum(after[1][key] - before[1].get(key, 0) for key in keys)
+                queries = round(total / count, 2) if count else None
+            results[name] = summarize(latencies, errors[0], elapsed, queries)
+            print_result(name, results[name])
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+def print_result(name, result):
+    print('{:<32} {:>9} rps  p50 {:>8} ms  p95 {:>8} ms  p99 {:>8} ms  queries {}  errors {}'.format(
+        name, result['throughput_rps'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+        result['queries_per_request'], result['errors']))
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(previous_path, results):
+    with open(previous_path) as previous_file:
+        previous = json.load(previous_file)['results']
+    print('\nComparacion con {}'.format(previous_path))
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        old = previous[name]
+        delta_p95 = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+        delta_rps = ((result['throughput_rps'] - old['throughput_rps']) / old['throughput_rps'] * 100
+                     if old['throughput_rps'] else 0)
+        print('{:<32} p95 {:+7.1f}%  rps {:+7.1f}%'.format(name, delta_p95, delta_rps))
+
+def main():
+    args = parse_args()
+    configure_env(args)
+    app = seed(args)
+    print('Sembrado: {} users, {} people, {} planets, {} favoritos por usuario ({})'.format(
+        args.users, args.people, args.planets, args.favorites, args.mode))
+    results = run_client(app, args) if args.mode == 'client' else run_gunicorn(args)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': args.database_url.split('://')[0],
+            'mode': args.mode,
+            'workers': args.workers if args.mode == 'gunicorn' else None,
+            'concurrency': args.concurrency if args.mode == 'gunicorn' else 1,
+            'cache': args.cache,
+            'volumes': {'users': args.users, 'people': args.people, 'planets': args.planets,
+                        'favorites_per_user': args.favorites},
+            'requests_per_endpoint': args.requests,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print('Resultados en {}'.format(args.output))
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == '__main__':
+    main()
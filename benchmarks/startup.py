@@ -0,0 +1,172 @@
+"""
+Benchmark del arranque de la app.
+
+Cada corrida es un proceso nuevo de Python (como un worker de gunicorn recien
+creado) que mide:
+
+    import_ms          importar el modulo app (Flask, extensiones, modelos)
+    create_app_ms      create_app(): config, extensiones, admin y rutas
+    first_request_ms   primer GET / (arma el sitemap)
+    sitemap_cached_ms  segundo GET / (sitemap ya cacheado)
+    first_query_ms     primer GET /people (primera conexion y query)
+
+y el total hasta el primer request. Se corre con y sin Flask-Admin
+(ADMIN_ENABLED) y se escribe la mediana y el minimo de cada fase en JSON:
+
+    pipenv run bench-startup --runs 20 --output before.json
+    pipenv run bench-startup --runs 20 --output after.json --compare before.json
+    pipenv run bench-startup --importtime   # modulos mas lentos de importar
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+PHASES = ('import_ms', 'create_app_ms', 'first_request_ms', 'sitemap_cached_ms', 'first_query_ms',
+          'time_to_first_request_ms')
+VARIANTS = {'admin': 'true', 'api_only': 'false'}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Procesos por variante')
+    parser.add_argument('--variants', nargs='+', choices=sorted(VARIANTS), default=sorted(VARIANTS))
+    parser.add_argument('--importtime', action='store_true',
+                        help='Muestra los modulos que mas tardan en importarse (python -X importtime)')
+    parser.add_argument('--top', type=int, default=15, help='Modulos a mostrar con --importtime')
+    parser.add_argument('--output', default='startup_results.json')
+    parser.add_argument('--compare', help='JSON de una corrida anterior para mostrar la diferencia')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def measure():
+    """Corre dentro del proceso hijo: mide cada fase e imprime el resultado en JSON."""
+    import time
+    started = time.perf_counter()
+    sys.path.insert(0, SRC)
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    client = app.test_client()
+    assert client.get('/').status_code == 200
+    first = time.perf_counter()
+    client.get('/')
+    cached = time.perf_counter()
+    assert client.get('/people?limit=1').status_code == 200
+    queried = time.perf_counter()
+    print(json.dumps({
+        'import_ms': (imported - started) * 1000,
+        'create_app_ms': (created - imported) * 1000,
+        'first_request_ms': (first - created) * 1000,
+        'sitemap_cached_ms': (cached - first) * 1000,
+        'first_query_ms': (queried - cached) * 1000,
+        'time_to_first_request_ms': (first - started) * 1000,
+    }))
+
+def prepare_database():
+    # tablas vacias en un SQLite temporal, creadas desde otro proceso para no calentar los hijos
+    url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db')
+    script = ('import sys; sys.path.insert(0, {!r}); from app import create_app; from models import db; '
+              'app = create_app(); app.app_context().push(); db.create_all()').format(SRC)
+    subprocess.check_call([sys.executable, '-c', script], env=child_env(url, 'false'))
+    return url
+
+def child_env(database_url, admin):
+    env = os.environ.copy()
+    env.update({'DATABASE_URL': database_url, 'ADMIN_ENABLED': admin, 'CACHE_URL': 'none',
+                'RATELIMIT_ENABLED': 'false'})
+    env.pop('DATABASE_READ_URL', None)
+    return env
+
+def run_variant(database_url, admin, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child'],
+                                         env=child_env(database_url, admin))
+        samples.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+    result = {}
+    for phase in PHASES:
+        values = [sample[phase] for sample in samples]
+        result[phase] = {'median': round(statistics.median(values), 2), 'min': round(min(values), 2)}
+    return result
+
+def print_result(name, result):
+    print('{:<10} '.format(name) + '  '.join('{} {:>8}'.format(phase[:-3], result[phase]['median'])
+                                             for phase in PHASES) + '  (mediana, ms)')
+
+def import_times(database_url, admin, top):
+    # python -X importtime escribe en stderr: "import time: self [us] | cumulative | paquete"
+    script = 'import sys; sys.path.insert(0, {!r}); from app import create_app; create_app()'.format(SRC)
+    command = [sys.executable, '-X', 'importtime', '-c', script]
+    stderr = subprocess.run(command, env=child_env(database_url, admin), stderr=subprocess.PIPE,
+                            check=True).stderr.decode('utf-8')
+    modules = []
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # un espacio por delante es import directo del script, tres son los imports de app y admin;
+        # mas profundos ya estan sumados en el cumulative de su padre
+        depth = len(name) - len(name.lstrip(' '))
+        if depth in (1, 3):
+            modules.append((int(parts[1]) / 1000, name.strip()))
+    print('\nModulos mas lentos al importar app y correr create_app() (ms acumulados):')
+    for elapsed, name in sorted(modules, reverse=True)[:top]:
+        print('{:>9.1f}  {}'.format(elapsed, name))
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(previous_path, results):
+    with open(previous_path) as previous_file:
+        previous = json.load(previous_file)['results']
+    print('\nComparacion con {}'.format(previous_path))
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        deltas = []
+        for phase in PHASES:
+            old = previous[name].get(phase, {}).get('median')
+            if old:
+                deltas.append('{} {:+7.1f}%'.format(phase[:-3], (result[phase]['median'] - old) / old * 100))
+        print('{:<10} {}'.format(name, '  '.join(deltas)))
+
+def main():
+    args = parse_args()
+    if args.child:
+        return measure()
+    database_url = prepare_database()
+    results = {}
+    for name in args.variants:
+        results[name] = run_variant(database_url, VARIANTS[name], args.runs)
+        print_result(name, results[name])
+    if args.importtime:
+        import_times(database_url, 'true', args.top)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'runs': args.runs,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print('Resultados en {}'.format(args.output))
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,19 @@ from flask_admin import Admin
 from models import db, User, Planets, People, Favorites_Planets, Favorites_People
 from flask_admin.contrib.sqla import ModelView
 
+try:
+    # Flask-Admin 2 reemplazo template_mode por temas
+    from flask_admin.theme import Bootstrap4Theme
+except ImportError:
+    Bootstrap4Theme = None
+
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
-    admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
+    if Bootstrap4Theme is not None:
+        admin = Admin(app, name='4Geeks Admin', theme=Bootstrap4Theme(swatch='cerulean'))
+    else:
+        admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
     
     # Add your models here, for example this is how we add a the User model to the admin
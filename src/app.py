@@ -2,56 +2,128 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
+import json
+import click
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, url_for, stream_with_context
 from flask_migrate import Migrate
-from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
-from models import db, User, People, Planets, Favorites_People, Favorites_Planets
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import DataError, IntegrityError
+from utils import APIException, batch_load, generate_sitemap, keyset_paginate, paginated_response, parse_flag
+from utils import parse_fields, parse_top_limit, require_id
+from bulk import bulk_save, bulk_delete, iter_body_items
+from cache import cache
+from counters import FAVORITES_COUNTERS, adjust_favorites_count, delete_dependent_favorites
+from counters import reconcile_favorites_counts, top_favorited
+from conditional import conditional, init_versions
+from export import EXPORT_FORMATS, EXPORT_MODELS, iter_export
+from jobs import enqueue, init_jobs, iter_job_output, run_workers
+from metrics import metrics
+from serializers import FastJSONProvider
+from ratelimit import limiter, rate_limit_cost
+from models import db, READ_BIND, User, People, Planets, Favorites_People, Favorites_Planets, Job, Job_Output
+from models import engine_options, favorites_query, serialize_favorite
 #from models import Person
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
+MIGRATE = Migrate()
+metrics.add_gauges('response_cache', 'Contadores del cache de lectura',
+                   lambda: dict((k, v) for k, v in cache.stats().items() if k != 'backend'))
+metrics.add_gauges('rate_limit', 'Requests aceptados/rechazados y tokens consumidos por presupuesto', limiter.stats)
 
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# todas las rutas y comandos de la API; create_app las registra en cada app
+api = Blueprint('api', __name__, cli_group=None)
 
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
+def create_app(config=None):
+    """Crea la app. config sobrescribe lo que se lee de las variables de entorno."""
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    # orjson cuando esta instalado, misma salida que el encoder estandar
+    app.json = FastJSONProvider(app)
+
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # replica de lectura opcional: todos los GET se leen de ahi, las escrituras van a DATABASE_URL
+    db_read_url = os.getenv("DATABASE_READ_URL")
+    if db_read_url is not None:
+        app.config['SQLALCHEMY_BINDS'] = {READ_BIND: db_read_url.replace("postgres://", "postgresql://")}
+
+    # pool de conexiones configurable (DB_POOL_*), el mismo que usa asgi.py
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    # los workers que solo sirven la API pueden arrancar sin Flask-Admin
+    app.config['ADMIN_ENABLED'] = os.getenv('ADMIN_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+    if config is not None:
+        app.config.update(config)
+
+    MIGRATE.init_app(app, db)
+    db.init_app(app)
+    CORS(app)
+    if app.config['ADMIN_ENABLED']:
+        # Flask-Admin y sus templates solo se importan si este proceso sirve /admin
+        from admin import setup_admin
+        setup_admin(app)
+    cache.init_app(app, User, People, Planets)
+    init_versions(app)
+    metrics.init_app(app)
+    limiter.init_app(app)
+    init_jobs(app)
+    app.register_blueprint(api)
+    return app
 
 # Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
 # generate sitemap with all your endpoints
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return generate_sitemap(current_app)
+
+@api.route('/spec', methods=['GET'])
+@rate_limit_cost(0)
+def get_spec():
+    # flask_swagger lee los docstrings de todas las rutas: se importa y se genera una sola vez, al pedirlo
+    spec = current_app.extensions.get('swagger_spec')
+    if spec is None:
+        from flask_swagger import swagger
+        spec = current_app.extensions['swagger_spec'] = swagger(current_app)
+    return jsonify(spec)
+
+@api.route('/metrics', methods=['GET'])
+@rate_limit_cost(0)
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/cache/stats', methods=['GET'])
+@rate_limit_cost(0)
+def get_cache_stats():
+    return jsonify(cache.stats()), 200
 
 # Metodos de User
-@app.route('/user', methods=['GET'])
+@api.route('/user', methods=['GET'])
+@rate_limit_cost(2)
+@conditional(User)
 def get_users():
-    users = User.query.all()  
-    user_list = list(map(lambda user: user.serialize(), users))
-    return jsonify(user_list), 200
+    # ?ids=1,2,3 lee esos ids en una sola query en vez de paginar
+    loader = batch_load if 'ids' in request.args else keyset_paginate
+    user_list, next_url = cache.load_list(User, lambda: loader(User))
+    return paginated_response(user_list, next_url), 200
 
 
-@app.route('/user/<int:user_id>', methods=['GET'])
+@api.route('/user/<int:user_id>', methods=['GET'])
+@conditional(User)
 def get_user_id(user_id):
-    user = User.query.get(user_id)
+    user = cache.load_item(User, user_id, parse_fields(User, request.args))
     if user is None:
         return jsonify({'msg':'User not found'}), 400
     else:
-        return jsonify({'msg':'ok','inf':user.serialize()})
-@app.route('/user', methods=['POST'])
+        return jsonify({'msg':'ok','inf':user})
+@api.route('/user', methods=['POST'])
 def create_user():
     body = request.get_json(silent = True)
     if body is None:
@@ -70,7 +142,7 @@ def create_user():
 
     return jsonify({'msg': 'ok'}),200
 
-@app.route('/user/<int:user_id>', methods=['PUT'])
+@api.route('/user/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     user = User.query.get(user_id)
     if user is None:
@@ -87,36 +159,60 @@ def update_user(user_id):
     db.session.commit()
     return jsonify({'msg':'ok'}), 200
 
-@app.route('/user/<int:user_id>', methods=['DELETE'])
+@api.route('/user/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     user = User.query.get(user_id)
     if user is None:
         raise APIException('El usuario con id {} no existe'.format(user_id), status_code=400)
+    # sus favoritos se borran en la misma transaccion
+    delete_dependent_favorites(db.session, User, [user.id])
     db.session.delete(user)
     db.session.commit()
     return jsonify({'msg':'ok'}), 200
 
+@api.route('/user/bulk', methods=['POST'])
+@rate_limit_cost(20)
+def bulk_save_users():
+    return jsonify(bulk_save(User)), 200
+
+@api.route('/user/bulk', methods=['DELETE'])
+@rate_limit_cost(20)
+def bulk_delete_users():
+    return jsonify(bulk_delete(User)), 200
+
 #Metodos de Tabla Planets
 
-@app.route('/planets', methods=['GET'])
+@api.route('/planets', methods=['GET'])
+@rate_limit_cost(2)
+@conditional(Planets)
 def get_planet():
-    planets = Planets.query.all()  
-    planets_list = list(map(lambda planets: planets.serialize(), planets))
-    return jsonify(planets_list), 200
+    # ?ids=1,2,3 lee esos ids en una sola query en vez de paginar
+    loader = batch_load if 'ids' in request.args else keyset_paginate
+    planets_list, next_url = cache.load_list(Planets, lambda: loader(Planets))
+    return paginated_response(planets_list, next_url), 200
 
-@app.route('/planets/<int:planet_id>', methods=['GET'])
+@api.route('/planets/top', methods=['GET'])
+@rate_limit_cost(2)
+@conditional(Planets, counts=True)
+def get_top_planets():
+    # ?limit=N, los mas favoritos primero segun el contador denormalizado
+    limit = parse_top_limit(request.args)
+    top, _ = cache.load_list(Planets, lambda: (top_favorited(Planets, limit), None))
+    return jsonify(top), 200
+
+@api.route('/planets/<int:planet_id>', methods=['GET'])
+@conditional(Planets)
 def get_planet_id(planet_id):
-    planet = Planets.query.get(planet_id)
+    planet = cache.load_item(Planets, planet_id, parse_fields(Planets, request.args))
     if planet is None:
         return jsonify({'msg': 'Planet not found'}), 400
     else:
-        return jsonify({'msg': 'ok', 'inf': planet.serialize()})
+        return jsonify({'msg': 'ok', 'inf': planet})
 
 
-@app.route('/planets', methods=['POST'])
+@api.route('/planets', methods=['POST'])
 def create_planet():
     body = request.get_json(silent=True)
-    print(body)
     if body is None:
         return jsonify({'msg': 'Debes enviar informacion en el body'}), 400
     if 'name' not in body:
@@ -131,7 +227,7 @@ def create_planet():
 
     return jsonify({'msg': 'ok'}),200
     
-@app.route('/planets/<int:planet_id>', methods=['PUT'])
+@api.route('/planets/<int:planet_id>', methods=['PUT'])
 def update_planets(planet_id):
     planet = Planets.query.get(planet_id)
     if planet is None:
@@ -148,34 +244,62 @@ def update_planets(planet_id):
     db.session.commit()
     return jsonify({'msg':'ok'}), 200
 
-@app.route('/planets/<int:planet_id>', methods=['DELETE'])
+@api.route('/planets/<int:planet_id>', methods=['DELETE'])
 def delete_planet(planet_id):
     planet = Planets.query.get(planet_id)
     if planet is None:
         raise APIException('El planeta con id {} no existe'.format(planet_id), status_code=400)
+    # sus favoritos se borran en la misma transaccion
+    delete_dependent_favorites(db.session, Planets, [planet.id])
     db.session.delete(planet)
     db.session.commit()
     return jsonify({'msg':'ok'}), 200
 
+@api.route('/planets/bulk', methods=['POST'])
+@rate_limit_cost(20)
+def bulk_save_planets():
+    # ?async=true: se encola como job y se responde 202 sin esperar la importacion
+    if parse_flag(request.args, 'async', False):
+        items = [item for _, item in iter_body_items()]
+        return job_accepted(enqueue('bulk_import', {'table': 'planets', 'items': items}))
+    return jsonify(bulk_save(Planets)), 200
+
+@api.route('/planets/bulk', methods=['DELETE'])
+@rate_limit_cost(20)
+def bulk_delete_planets():
+    return jsonify(bulk_delete(Planets)), 200
+
 # Tabla People
-@app.route('/people', methods=['GET'])
+@api.route('/people', methods=['GET'])
+@rate_limit_cost(2)
+@conditional(People)
 def get_people():
-    people = People.query.all()  
-    people_list = list(map(lambda people: people.serialize(), people))
-    return jsonify(people_list), 200
+    # ?ids=1,2,3 lee esos ids en una sola query en vez de paginar
+    loader = batch_load if 'ids' in request.args else keyset_paginate
+    people_list, next_url = cache.load_list(People, lambda: loader(People))
+    return paginated_response(people_list, next_url), 200
+
+@api.route('/people/top', methods=['GET'])
+@rate_limit_cost(2)
+@conditional(People, counts=True)
+def get_top_people():
+    # ?limit=N, los mas favoritos primero segun el contador denormalizado
+    limit = parse_top_limit(request.args)
+    top, _ = cache.load_list(People, lambda: (top_favorited(People, limit), None))
+    return jsonify(top), 200
 
-@app.route('/people/<int:people_id>', methods=['GET'])
+@api.route('/people/<int:people_id>', methods=['GET'])
+@conditional(People)
 def get_people_id(people_id):
-    people = People.query.get(people_id)
+    people = cache.load_item(People, people_id, parse_fields(People, request.args))
     if people is None:
         return jsonify({'msg': 'People not found'}), 400
     else:
-        return jsonify({'msg': 'ok', 'inf': people.serialize()})
+        return jsonify({'msg': 'ok', 'inf': people})
     
-@app.route('/people', methods=['POST'])
+@api.route('/people', methods=['POST'])
 def create_people():
     body = request.get_json(silent=True)
-    print(body)
     if body is None:
         return jsonify({'msg': 'Debes enviar informacion en el body'}), 400
     if 'name' not in body:
@@ -191,7 +315,7 @@ def create_people():
 
     return jsonify({'msg': 'ok'}),200
 
-@app.route('/people/<int:people_id>', methods=['PUT'])
+@api.route('/people/<int:people_id>', methods=['PUT'])
 def update_people(people_id):
     people = People.query.get(people_id)
     if people is None:
@@ -208,73 +332,216 @@ def update_people(people_id):
     db.session.commit()
     return jsonify({'msg':'ok'}), 200
 
-@app.route('/people/<int:people_id>', methods=['DELETE'])
+@api.route('/people/<int:people_id>', methods=['DELETE'])
 def delete_people(people_id):
     people = People.query.get(people_id)
     if people is None:
         raise APIException('El personaje con id {} no existe'.format(people_id), status_code=400)
+    # sus favoritos se borran en la misma transaccion
+    delete_dependent_favorites(db.session, People, [people.id])
     db.session.delete(people)
     db.session.commit()
     return jsonify({'msg':'ok'}), 200
     
-# Tablas favoritos  El resultado que me devuelve es en numero y supongo q debe ser en string
-@app.route('/user/<int:id_user>/favorites', methods=['GET'])
+@api.route('/people/bulk', methods=['POST'])
+@rate_limit_cost(20)
+def bulk_save_people():
+    # ?async=true: se encola como job y se responde 202 sin esperar la importacion
+    if parse_flag(request.args, 'async', False):
+        items = [item for _, item in iter_body_items()]
+        return job_accepted(enqueue('bulk_import', {'table': 'people', 'items': items}))
+    return jsonify(bulk_save(People)), 200
+
+@api.route('/people/bulk', methods=['DELETE'])
+@rate_limit_cost(20)
+def bulk_delete_people():
+    return jsonify(bulk_delete(People)), 200
+
+# Tablas favoritos
+@api.route('/user/<int:id_user>/favorites', methods=['GET'])
 def get_favorites_de_user_planet(id_user):
-    favorites_planet = Favorites_Planets.query.filter_by(user_id = id_user)
-    favorites_people = Favorites_People.query.filter_by(user_id = id_user)
-    favorites_list1 = list(map(lambda favorite: favorite.serialize(), favorites_planet))
-    favorites_list2 = list(map(lambda favorite: favorite.serialize(), favorites_people))
-    favorites_list1.extend(favorites_list2)
-    return jsonify({'msg': 'ok', 'inf': favorites_list1})
-
-@app.route('/favorites_planets/<int:user_id>', methods=['POST'])
+    # ?expand=false devuelve solo los ids, como antes
+    expand = parse_flag(request.args, 'expand')
+    rows = db.session.execute(favorites_query(id_user, expand))
+    favorites_list = [serialize_favorite(row, expand) for row in rows]
+    return jsonify({'msg': 'ok', 'inf': favorites_list})
+
+# Crear un favorito es idempotente: si el par (usuario, entidad) ya existe se devuelve esa fila
+def upsert_favorite(model, **key):
+    favorite = model.query.filter_by(**key).first()
+    if favorite is not None:
+        return favorite
+    favorite = model(**key)
+    db.session.add(favorite)
+    try:
+        # el INSERT va primero: si el favorito ya existia falla antes de bloquear la fila del contador
+        db.session.flush()
+        _, field = FAVORITES_COUNTERS[model]
+        adjust_favorites_count(db.session, model, [key[field]], 1)
+        db.session.commit()
+    except (IntegrityError, DataError):
+        # otra peticion lo creo a la vez, el usuario/entidad no existe o el id no cabe en la columna
+        db.session.rollback()
+        favorite = model.query.filter_by(**key).first()
+        if favorite is None:
+            raise APIException('El usuario o la entidad no existe', status_code=400)
+    return favorite
+
+@api.route('/favorites_planets/<int:user_id>', methods=['POST'])
 def create_favorites_planets(user_id):
     body = request.get_json(silent=True)
-    print(body)
     if body is None:
         return jsonify({'msg': 'Debes enviar informacion en el body'}), 400
-    
-    new_favorite_planet = Favorites_Planets()
-    new_favorite_planet.planet_id = body['planet_id']
-    new_favorite_planet.user_id = user_id
-    db.session.add(new_favorite_planet)
-    db.session.commit()
+    if not isinstance(body, dict):
+        raise APIException('El body debe ser un objeto JSON', status_code=400)
+    if 'planet_id' not in body:
+        return jsonify({'msg': 'Debes enviar un planet_id en el body'}), 400
 
-    return jsonify({'msg': 'ok'}),200
-@app.route('/favorites_planets/<int:favorite_planets_id>', methods=['DELETE'])
+    favorite = upsert_favorite(Favorites_Planets, user_id=user_id, planet_id=require_id(body['planet_id'], 'planet_id'))
+    return jsonify({'msg': 'ok', 'inf': favorite.serialize()}),200
+
+@api.route('/favorites_planets/<int:favorite_planets_id>', methods=['DELETE'])
 def delete_favorites_planets(favorite_planets_id):
     favorites_planets = Favorites_Planets.query.get(favorite_planets_id)
-    if favorite_planets_id is None:
+    if favorites_planets is None:
         raise APIException('La relacion de favoritos planetas con id {} no existe'.format(favorite_planets_id), status_code=400)
     db.session.delete(favorites_planets)
+    adjust_favorites_count(db.session, Favorites_Planets, [favorites_planets.planet_id], -1)
     db.session.commit()
     return jsonify({'msg':'ok'}), 200
 
-@app.route('/favorites_people/<int:user_id>', methods=['POST'])
+@api.route('/favorites_people/<int:user_id>', methods=['POST'])
 def create_favorites_people(user_id):
     body = request.get_json(silent=True)
-    print(body)
     if body is None:
         return jsonify({'msg': 'Debes enviar informacion en el body'}), 400
-    
-    new_favorite_people = Favorites_People()
-    new_favorite_people.people_id = body['people_id']
-    new_favorite_people.user_id = body['user_id']
-    db.session.add(new_favorite_people)
-    db.session.commit()
+    if not isinstance(body, dict):
+        raise APIException('El body debe ser un objeto JSON', status_code=400)
+    if 'people_id' not in body:
+        return jsonify({'msg': 'Debes enviar un people_id en el body'}), 400
 
-    return jsonify({'msg': 'ok'}),200
+    favorite = upsert_favorite(Favorites_People, user_id=require_id(body.get('user_id', user_id), 'user_id'),
+                               people_id=require_id(body['people_id'], 'people_id'))
+    return jsonify({'msg': 'ok', 'inf': favorite.serialize()}),200
 
-@app.route('/favorites_people/<int:favorite_people_id>', methods=['DELETE'])
+@api.route('/favorites_people/<int:favorite_people_id>', methods=['DELETE'])
 def delete_favorites_people(favorite_people_id):
     favorites_people = Favorites_People.query.get(favorite_people_id)
-    if favorite_people_id is None:
+    if favorites_people is None:
         raise APIException('La relacion de favoritos planetas con id {} no existe'.format(favorite_people_id), status_code=400)
     db.session.delete(favorites_people)
+    adjust_favorites_count(db.session, Favorites_People, [favorites_people.people_id], -1)
     db.session.commit()
     return jsonify({'msg':'ok'}), 200
 
+@api.route('/favorites_planets/bulk', methods=['POST'])
+@rate_limit_cost(20)
+def bulk_save_favorites_planets():
+    return jsonify(bulk_save(Favorites_Planets)), 200
+
+@api.route('/favorites_planets/bulk', methods=['DELETE'])
+@rate_limit_cost(20)
+def bulk_delete_favorites_planets():
+    return jsonify(bulk_delete(Favorites_Planets)), 200
+
+@api.route('/favorites_people/bulk', methods=['POST'])
+@rate_limit_cost(20)
+def bulk_save_favorites_people():
+    return jsonify(bulk_save(Favorites_People)), 200
+
+@api.route('/favorites_people/bulk', methods=['DELETE'])
+@rate_limit_cost(20)
+def bulk_delete_favorites_people():
+    return jsonify(bulk_delete(Favorites_People)), 200
+
+# Exportar tablas completas en streaming
+@api.route('/export/<table>', methods=['GET'])
+@rate_limit_cost(50)
+def export_table(table):
+    if table not in EXPORT_MODELS:
+        raise APIException('La tabla {} no se puede exportar'.format(table), status_code=404)
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        raise APIException('format debe ser ndjson o json', status_code=400)
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'application/json'
+    response = Response(stream_with_context(iter_export(EXPORT_MODELS[table], export_format)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename={}.{}'.format(table, export_format)
+    return response
+
+# Trabajos en segundo plano (los ejecuta `flask worker`)
+def job_accepted(job):
+    response = jsonify({'msg': 'ok', 'inf': job.serialize()})
+    response.headers['Location'] = url_for('api.get_job', job_id=job.id)
+    return response, 202
+
+@api.route('/jobs', methods=['POST'])
+@rate_limit_cost(5)
+def create_job():
+    body = request.get_json(silent=True)
+    if body is None or 'kind' not in body:
+        return jsonify({'msg': 'Debes enviar un kind en el body'}), 400
+    return job_accepted(enqueue(body['kind'], body.get('payload', {})))
+
+@api.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'msg': 'Job not found'}), 400
+    return jsonify({'msg': 'ok', 'inf': job.serialize()}), 200
+
+@api.route('/jobs/<int:job_id>/download', methods=['GET'])
+def download_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or job.kind != 'export':
+        return jsonify({'msg': 'Export not found'}), 400
+    if job.status != 'done':
+        return jsonify({'msg': 'El export todavia no termino', 'inf': job.serialize()}), 409
+    if db.session.query(Job_Output.seq).filter(Job_Output.job_id == job.id).first() is None:
+        # exports hechos cuando se guardaban en el disco del worker
+        return jsonify({'msg': 'El export ya no esta disponible, vuelve a pedirlo'}), 410
+    payload = json.loads(job.payload)
+    mimetype = 'application/x-ndjson' if payload['format'] == 'ndjson' else 'application/json'
+    response = Response(stream_with_context(iter_job_output(job.id)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename={}.{}'.format(payload['table'], payload['format'])
+    return response
+
+@api.cli.command('export')
+@click.argument('table', type=click.Choice(sorted(EXPORT_MODELS)))
+@click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS), default='ndjson')
+@click.option('--output', type=click.File('w'), default='-', help='Archivo de salida (por defecto stdout)')
+def export_command(table, export_format, output):
+    """Exporta una tabla completa en NDJSON o JSON."""
+    for chunk in iter_export(EXPORT_MODELS[table], export_format):
+        output.write(chunk)
+
+@api.cli.command('dedupe-favorites')
+def dedupe_favorites_command():
+    """Borra favoritos duplicados (se queda con el id mas bajo). Correr antes de migrar los indices unicos."""
+    for model in (Favorites_Planets, Favorites_People):
+        keep = select(func.min(model.id).label('id')).group_by(*[getattr(model, field) for field in model.natural_key]).subquery()
+        result = db.session.execute(delete(model).where(model.id.not_in(select(keep.c.id)))
+                                    .execution_options(synchronize_session=False))
+        click.echo('{}: {} duplicados borrados'.format(model.__tablename__, result.rowcount))
+    # los duplicados tambien estaban sumados en favorites_count
+    reconcile_favorites_counts(db.session)
+    db.session.commit()
+
+@api.cli.command('worker')
+@click.option('--concurrency', type=int, default=1, help='Jobs en paralelo')
+@click.option('--processes', is_flag=True, help='Un proceso por job en paralelo en vez de threads')
+@click.option('--burst', is_flag=True, help='Procesa lo que haya en la cola y termina')
+def worker_command(concurrency, processes, burst):
+    """Ejecuta los jobs encolados en la tabla job."""
+    run_workers(current_app._get_current_object(), concurrency, processes, burst)
+
+@api.cli.command('reconcile-favorites')
+def reconcile_favorites_command():
+    """Recalcula favorites_count de planets y people desde las tablas de favoritos."""
+    for table, fixed in reconcile_favorites_counts(db.session).items():
+        click.echo('{}: {} contadores corregidos'.format(table, fixed))
+    db.session.commit()
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0', port=PORT, debug=False)
+    create_app().run(host='0.0.0.0', port=PORT, debug=False)
@@ -0,0 +1,220 @@
+"""
+Punto de entrada ASGI con el engine asyncio de SQLAlchemy.
+
+Sirve las lecturas (user, people, planets y favoritos) y la creacion de
+favoritos sin bloquear un worker por cada query: un solo proceso atiende muchas
+consultas lentas a la vez. Usa los mismos modelos y la misma paginacion que la
+app Flask (src/wsgi.py), que sigue funcionando igual. Responde HEAD y OPTIONS
+(preflight de CORS) con los mismos headers que la app Flask con flask-cors.
+
+    uvicorn asgi:app --app-dir src --port 3001
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --chdir ./src/
+
+La URL sale de ASYNC_DATABASE_URL o, si no esta, de DATABASE_URL cambiando el
+driver: sqlite -> aiosqlite, postgresql -> asyncpg.
+"""
+import os
+import json
+import re
+from urllib.parse import parse_qsl, urlencode
+from sqlalchemy import select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from werkzeug.datastructures import MultiDict
+from utils import APIException, IdBatch, KeysetPage, parse_flag, require_id
+from serializers import public_select, row_to_dict
+from counters import FAVORITES_COUNTERS, adjust_favorites_count
+from conditional import init_versions
+from models import User, People, Planets, Favorites_People, Favorites_Planets, engine_options
+from models import favorites_query, serialize_favorite
+
+def async_database_url():
+    url = os.getenv('ASYNC_DATABASE_URL')
+    if url is not None:
+        return url
+    url = os.getenv('DATABASE_URL', 'sqlite:////tmp/test.db')
+    url = url.replace('postgres://', 'postgresql://', 1)
+    if url.startswith('sqlite://'):
+        return url.replace('sqlite://', 'sqlite+aiosqlite://', 1)
+    if url.startswith('postgresql://'):
+        return url.replace('postgresql://', 'postgresql+asyncpg://', 1)
+    return url
+
+# mismo pool (DB_POOL_*) que la app Flask
+engine = create_async_engine(async_database_url(), **engine_options(async_database_url()))
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# los favoritos creados aqui suben la version de los contadores igual que en la app Flask
+init_versions()
+
+class Request(object):
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = dict((name.decode('latin-1').lower(), value.decode('latin-1'))
+                            for name, value in scope.get('headers', ()))
+        self.body = body
+
+    def get_json(self):
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+async def get_collection(request, session, model):
+    if 'ids' in request.args:
+        batch = IdBatch(model, request.args)
+        return 200, batch.items(await session.execute(batch.statement())), []
+    page = KeysetPage(model, request.args)
+    items = page.items(await session.execute(page.statement()))
+    headers = []
+    if page.next_args is not None:
+        next_url = '{}?{}'.format(request.path, urlencode(page.next_args))
+        headers.append((b'link', '<{}>; rel="next"'.format(next_url).encode('latin-1')))
+        headers.append((b'x-next-cursor', str(page.next_args['after']).encode('latin-1')))
+    return 200, items, headers
+
+async def get_item(request, session, model, id, not_found):
+    row = (await session.execute(public_select(model).where(model.id == int(id)))).first()
+    if row is None:
+        return 400, {'msg': not_found}, []
+    return 200, {'msg': 'ok', 'inf': row_to_dict(model, row)}, []
+
+async def get_favorites(request, session, id_user):
+    expand = parse_flag(request.args, 'expand')
+    rows = await session.execute(favorites_query(int(id_user), expand))
+    return 200, {'msg': 'ok', 'inf': [serialize_favorite(row, expand) for row in rows]}, []
+
+async def upsert_favorite(session, model, **key):
+    # igual que en app.py: si el par ya existe se devuelve la fila existente
+    query = select(model).filter_by(**key)
+    favorite = (await session.execute(query)).scalars().first()
+    if favorite is not None:
+        return favorite
+    favorite = model(**key)
+    session.add(favorite)
+    _, field = FAVORITES_COUNTERS[model]
+    try:
+        await session.flush()
+        await session.run_sync(adjust_favorites_count, model, [key[field]], 1)
+        await session.commit()
+    except (IntegrityError, DataError):
+        await session.rollback()
+        favorite = (await session.execute(query)).scalars().first()
+        if favorite is None:
+            raise APIException('El usuario o la entidad no existe', status_code=400)
+    return favorite
+
+async def create_favorite(request, session, user_id, model, field):
+    body = request.get_json()
+    if body is None:
+        return 400, {'msg': 'Debes enviar informacion en el body'}, []
+    if not isinstance(body, dict):
+        raise APIException('El body debe ser un objeto JSON', status_code=400)
+    if field not in body:
+        return 400, {'msg': 'Debes enviar un {} en el body'.format(field)}, []
+    user_id = int(user_id)
+    if model is Favorites_People:
+        user_id = require_id(body.get('user_id', user_id), 'user_id')
+    favorite = await upsert_favorite(session, model, **{'user_id': user_id, field: require_id(body[field], field)})
+    return 200, {'msg': 'ok', 'inf': favorite.serialize()}, []
+
+ROUTES = [
+    ('GET', r'/user', lambda request, session: get_collection(request, session, User)),
+    ('GET', r'/user/(?P<id>\d+)', lambda request, session, id: get_item(request, session, User, id, 'User not found')),
+    ('GET', r'/people', lambda request, session: get_collection(request, session, People)),
+    ('GET', r'/people/(?P<id>\d+)',
+     lambda request, session, id: get_item(request, session, People, id, 'People not found')),
+    ('GET', r'/planets', lambda request, session: get_collection(request, session, Planets)),
+    ('GET', r'/planets/(?P<id>\d+)',
+     lambda request, session, id: get_item(request, session, Planets, id, 'Planet not found')),
+    ('GET', r'/user/(?P<id_user>\d+)/favorites', get_favorites),
+    ('POST', r'/favorites_planets/(?P<user_id>\d+)',
+     lambda request, session, user_id: create_favorite(request, session, user_id, Favorites_Planets, 'planet_id')),
+    ('POST', r'/favorites_people/(?P<user_id>\d+)',
+     lambda request, session, user_id: create_favorite(request, session, user_id, Favorites_People, 'people_id')),
+]
+ROUTES = [(method, re.compile('^' + pattern + '/?$'), handler) for method, pattern, handler in ROUTES]
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+# los mismos headers que pone flask-cors (CORS(app) en app.py) con su configuracion por defecto
+CORS_METHODS = 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+def cors_headers(request):
+    origin = request.headers.get('origin')
+    if origin is None:
+        return [(b'access-control-allow-origin', b'*')]
+    return [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+
+def preflight_headers(request, methods):
+    # OPTIONS: como Flask, Allow lista los metodos de la ruta; el preflight de CORS ademas
+    # acepta los headers que pide el navegador
+    allowed = set(methods) | {'OPTIONS'} | ({'HEAD'} if 'GET' in methods else set())
+    headers = [(b'allow', ', '.join(sorted(allowed)).encode('latin-1'))]
+    if 'origin' in request.headers and 'access-control-request-method' in request.headers:
+        headers.append((b'access-control-allow-methods', CORS_METHODS.encode('latin-1')))
+        if 'access-control-request-headers' in request.headers:
+            headers.append((b'access-control-allow-headers',
+                            request.headers['access-control-request-headers'].encode('latin-1')))
+    return headers
+
+async def send_json(send, request, status, data, headers=()):
+    # sort_keys para que la salida sea igual a la de jsonify en la app Flask
+    payload = json.dumps(data, sort_keys=True).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(payload)).encode('latin-1'))]
+                           + cors_headers(request) + list(headers)})
+    # HEAD: mismos headers que el GET, sin cuerpo
+    await send({'type': 'http.response.body', 'body': b'' if request.method == 'HEAD' else payload})
+
+async def send_empty(send, request, headers):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-length', b'0')] + cors_headers(request) + headers})
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    request = Request(scope, await read_body(receive))
+    # HEAD se atiende con la ruta GET
+    method = 'GET' if request.method == 'HEAD' else request.method
+    methods = set()
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.match(request.path)
+        if match is None:
+            continue
+        methods.add(route_method)
+        if route_method != method:
+            continue
+        try:
+            async with Session() as session:
+                status, data, headers = await handler(request, session, **match.groupdict())
+        except APIException as error:
+            status, data, headers = error.status_code, error.to_dict(), []
+        return await send_json(send, request, status, data, headers)
+    if methods and method == 'OPTIONS':
+        return await send_empty(send, request, preflight_headers(request, methods))
+    if methods:
+        return await send_json(send, request, 405, {'message': 'Method Not Allowed'})
+    return await send_json(send, request, 404, {'message': 'Not Found'})
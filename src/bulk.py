@@ -0,0 +1,231 @@
+"""
+Escrituras en lote: valida cada item una vez y escribe por chunks con
+executemany (bulk_insert_mappings / bulk_update_mappings), un commit por chunk.
+Si un chunk falla en la base de datos se reintenta fila por fila con savepoints
+para que una fila mala no tumbe el resto del lote.
+"""
+import json
+from flask import request
+from sqlalchemy import tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from utils import APIException
+from cache import mark_changed
+from counters import count_bulk_delete, count_bulk_write, delete_dependent_favorites
+from models import db, User, People, Planets, Favorites_People, Favorites_Planets
+
+BULK_CHUNK_SIZE = 500
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonlines', 'application/jsonl')
+
+# campos aceptados por modelo y cuales son obligatorios al crear
+BULK_SCHEMAS = {
+    User: {'fields': {'name': str, 'email': str, 'password': str, 'is_active': bool},
+           'required': ('name', 'email', 'password'), 'defaults': {'is_active': True}},
+    People: {'fields': {'name': str, 'height': int, 'mass': int, 'hair_color': str},
+             'required': ('name',), 'defaults': {}},
+    Planets: {'fields': {'name': str, 'diameter': int, 'rotation_period': int},
+              'required': ('name',), 'defaults': {}},
+    Favorites_People: {'fields': {'user_id': int, 'people_id': int},
+                       'required': ('user_id', 'people_id'), 'defaults': {}},
+    Favorites_Planets: {'fields': {'user_id': int, 'planet_id': int},
+                        'required': ('user_id', 'planet_id'), 'defaults': {}},
+}
+
+def iter_body_items():
+    # acepta un array JSON o NDJSON (un objeto por linea, leido en streaming)
+    if request.mimetype in NDJSON_MIMETYPES:
+        for index, line in enumerate(request.stream):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError:
+                yield index, None
+        return
+    body = request.get_json(silent=True)
+    if not isinstance(body, list):
+        raise APIException('Debes enviar un array JSON o NDJSON en el body', status_code=400)
+    for index, item in enumerate(body):
+        yield index, item
+
+def iter_chunks(items, size=BULK_CHUNK_SIZE):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def check_type(value, expected):
+    if value is None:
+        return True
+    # bool es subclase de int, no lo aceptamos como numero
+    if expected is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, expected)
+
+def validate_item(schema, item):
+    """Devuelve (row, error). row es None si el item no es valido."""
+    if not isinstance(item, dict):
+        return None, 'El item debe ser un objeto JSON'
+    row = {}
+    if 'id' in item:
+        if not check_type(item['id'], int) or item['id'] is None:
+            return None, 'id debe ser un numero'
+        row['id'] = item['id']
+    for field, value in item.items():
+        if field == 'id':
+            continue
+        if field not in schema['fields']:
+            return None, 'Campo desconocido: {}'.format(field)
+        if not check_type(value, schema['fields'][field]):
+            return None, 'Tipo invalido para {}'.format(field)
+        row[field] = value
+    if 'id' not in row:
+        for field in schema['required']:
+            if row.get(field) is None:
+                return None, 'Debes enviar {} en el item'.format(field)
+        for field, value in schema['defaults'].items():
+            row.setdefault(field, value)
+    return row, None
+
+def existing_ids(model, ids):
+    if not ids:
+        return set()
+    return set(id for (id,) in db.session.query(model.id).filter(model.id.in_(ids)))
+
+def existing_keys(model, rows):
+    # para modelos con clave natural (favoritos) devuelve {clave: id} de las que ya existen
+    columns = [getattr(model, field) for field in model.natural_key]
+    keys = set(tuple(row[field] for field in model.natural_key) for _, row in rows)
+    if not keys:
+        return {}
+    query = db.session.query(model.id, *columns).filter(tuple_(*columns).in_(list(keys)))
+    return dict((tuple(row[1:]), row[0]) for row in query)
+
+def skip_existing(model, inserts, results):
+    """Quita de inserts las filas cuya clave natural ya existe, asi el POST es idempotente."""
+    found = existing_keys(model, inserts)
+    pending = []
+    for index, row in inserts:
+        key = tuple(row[field] for field in model.natural_key)
+        if key in found:
+            results[index] = {'index': index, 'status': 'exists'}
+            if found[key] is not None:
+                results[index]['id'] = found[key]
+        else:
+            # repetida dentro del mismo lote: solo se inserta la primera
+            found[key] = None
+            pending.append((index, row))
+    return pending
+
+def write_rows(model, inserts, updates):
+    # las operaciones bulk no pasan por el flush del ORM, avisamos al cache a mano
+    mark_changed(db.session, model.__tablename__, [row['id'] for _, row in updates])
+    # favoritos: los contadores de Planets/People se ajustan en la misma transaccion
+    count_bulk_write(db.session, model, [row for _, row in inserts], [row for _, row in updates])
+    if inserts:
+        db.session.bulk_insert_mappings(model, [row for _, row in inserts])
+    if updates:
+        db.session.bulk_update_mappings(model, [row for _, row in updates])
+
+def write_chunk(model, inserts, updates, results):
+    try:
+        write_rows(model, inserts, updates)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        # el chunk fallo entero, reintentamos fila por fila para aislar la mala
+        rows = [(index, row, False) for index, row in inserts] + [(index, row, True) for index, row in updates]
+        for index, row, is_update in rows:
+            savepoint = db.session.begin_nested()
+            try:
+                if is_update:
+                    write_rows(model, [], [(index, row)])
+                else:
+                    write_rows(model, [(index, row)], [])
+                savepoint.commit()
+            except SQLAlchemyError as error:
+                savepoint.rollback()
+                results[index] = {'index': index, 'status': 'error', 'msg': db_error_message(error)}
+        db.session.commit()
+
+def db_error_message(error):
+    return str(getattr(error, 'orig', None) or error)
+
+def bulk_save(model, items=None):
+    """Crea (items sin id) o actualiza (items con id) en lote. Sin items lee el body del request."""
+    schema = BULK_SCHEMAS[model]
+    results = {}
+    for chunk in iter_chunks(iter_body_items() if items is None else enumerate(items)):
+        inserts, updates = [], []
+        for index, item in chunk:
+            row, error = validate_item(schema, item)
+            if error is not None:
+                results[index] = {'index': index, 'status': 'error', 'msg': error}
+            elif 'id' in row:
+                updates.append((index, row))
+            else:
+                inserts.append((index, row))
+        found = existing_ids(model, [row['id'] for _, row in updates])
+        for index, row in updates:
+            if row['id'] not in found:
+                results[index] = {'index': index, 'status': 'error', 'msg': 'No existe el id {}'.format(row['id'])}
+        updates = [(index, row) for index, row in updates if row['id'] in found]
+        if hasattr(model, 'natural_key'):
+            inserts = skip_existing(model, inserts, results)
+        for index, row in inserts:
+            results[index] = {'index': index, 'status': 'created'}
+        for index, row in updates:
+            results[index] = {'index': index, 'status': 'updated', 'id': row['id']}
+        write_chunk(model, inserts, updates, results)
+    return summarize(results)
+
+def bulk_delete(model):
+    """Borra en lote a partir de un array de ids, junto con los favoritos que apuntan a ellos."""
+    results = {}
+    for chunk in iter_chunks(iter_body_items()):
+        ids = []
+        for index, id in chunk:
+            if not check_type(id, int) or id is None:
+                results[index] = {'index': index, 'status': 'error', 'msg': 'id debe ser un numero'}
+            else:
+                ids.append((index, id))
+        found = existing_ids(model, [id for _, id in ids])
+        for index, id in ids:
+            if id in found:
+                results[index] = {'index': index, 'status': 'deleted', 'id': id}
+            else:
+                results[index] = {'index': index, 'status': 'error', 'msg': 'No existe el id {}'.format(id)}
+        mark_changed(db.session, model.__tablename__, found)
+        try:
+            count_bulk_delete(db.session, model, found)
+            delete_dependent_favorites(db.session, model, found)
+            db.session.query(model).filter(model.id.in_(found)).delete(synchronize_session=False)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            for index, id in ids:
+                if id not in found:
+                    continue
+                savepoint = db.session.begin_nested()
+                try:
+                    mark_changed(db.session, model.__tablename__, [id])
+                    count_bulk_delete(db.session, model, [id])
+                    delete_dependent_favorites(db.session, model, [id])
+                    db.session.query(model).filter(model.id == id).delete(synchronize_session=False)
+                    savepoint.commit()
+                except SQLAlchemyError as error:
+                    savepoint.rollback()
+                    results[index] = {'index': index, 'status': 'error', 'msg': db_error_message(error)}
+            db.session.commit()
+    return summarize(results)
+
+def summarize(results):
+    items = [results[index] for index in sorted(results)]
+    summary = {}
+    for item in items:
+        summary[item['status']] = summary.get(item['status'], 0) + 1
+    return {'msg': 'ok', 'summary': summary, 'inf': items}
@@ -0,0 +1,194 @@
+"""
+Cache de lectura para los serializers de User, People y Planets.
+
+Backends:
+- LRUCache: en memoria del proceso, con TTL y limite de entradas (por defecto).
+- RedisCache: cualquier servidor compatible con Redis, compartido entre workers.
+  Se activa con CACHE_URL=redis://... y necesita el paquete `redis`.
+
+Las claves llevan la version de la tabla en `table_version` (la misma que usa
+el ETag de conditional.py). Los eventos de la sesion anotan que tablas toco cada
+transaccion y bump_versions sube su version al confirmar, asi que cualquier
+proceso que escriba (otro worker, `flask worker`) deja obsoletas las entradas de
+todos los demas: no hay que invalidar nada y el cuerpo cacheado nunca sale con
+un ETag de otra version. Las entradas viejas se van por TTL o por LRU.
+"""
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from serializers import load_public
+
+MISSING = object()
+
+class LRUCache(object):
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {'size': len(self.entries), 'evictions': self.evictions}
+
+class RedisCache(object):
+    def __init__(self, url, ttl=300, prefix='api-cache:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_URL apunta a Redis pero el paquete redis no esta instalado')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return MISSING
+        return json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def stats(self):
+        info = self.client.info('stats')
+        return {'size': self.client.dbsize(), 'evictions': info.get('evicted_keys', 0)}
+
+class NullCache(object):
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value):
+        pass
+
+    def stats(self):
+        return {'size': 0, 'evictions': 0}
+
+class CacheState(object):
+    """Backend y contadores de una app; vive en app.extensions['response_cache']."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+class ResponseCache(object):
+    def __init__(self):
+        # tablas cacheadas: dependen de los modelos, no de la app, y record_flush las
+        # consulta tambien fuera de un app context (sesiones async, scripts)
+        self.tables = set()
+
+    def init_app(self, app, *models):
+        app.config.setdefault('CACHE_URL', os.getenv('CACHE_URL', 'memory'))
+        app.config.setdefault('CACHE_TTL', int(os.getenv('CACHE_TTL', 300)))
+        app.config.setdefault('CACHE_MAX_ENTRIES', int(os.getenv('CACHE_MAX_ENTRIES', 1024)))
+        url = app.config['CACHE_URL']
+        if url in ('none', 'off', ''):
+            backend = NullCache()
+        elif url.startswith('redis://') or url.startswith('rediss://'):
+            backend = RedisCache(url, ttl=app.config['CACHE_TTL'])
+        else:
+            backend = LRUCache(app.config['CACHE_MAX_ENTRIES'], ttl=app.config['CACHE_TTL'])
+        # cada app tiene su backend: un segundo create_app no toca el del primero
+        app.extensions['response_cache'] = CacheState(backend)
+        self.tables.update(model.__tablename__ for model in models)
+        # after_commit y after_soft_rollback los registra conditional.init_versions
+        if not event.contains(Session, 'after_flush', record_flush):
+            event.listen(Session, 'after_flush', record_flush)
+
+    @property
+    def state(self):
+        return current_app.extensions['response_cache']
+
+    @property
+    def backend(self):
+        return self.state.backend
+
+    def get_or_load(self, key, loader):
+        state = self.state
+        value = state.backend.get(key)
+        if value is not MISSING:
+            state.hits += 1
+            return value
+        state.misses += 1
+        value = loader()
+        if value is not None:
+            state.backend.set(key, value)
+        return value
+
+    def version(self, model):
+        """Version de la tabla para este request, la misma con la que @conditional arma el ETag."""
+        # import tardio: conditional importa este modulo
+        from conditional import request_version
+        return request_version(model)[0]
+
+    def load_item(self, model, id, fields=None):
+        # se cachea la fila con todos los campos y se recorta a los pedidos (public_fields por defecto)
+        item = self.get_or_load('{}:item:{}:{}'.format(model.__tablename__, self.version(model), id),
+                                lambda: load_public(model.query.session, model, id))
+        if item is None:
+            return None
+        return dict((field, item[field]) for field in (fields or model.public_fields))
+
+    def load_list(self, model, loader):
+        table = model.__tablename__
+        # la query string ordenada identifica la pagina (limit, after, fields...); urlencode escapa
+        # & y = dentro de los valores para que dos queries distintas no compartan clave
+        args = urlencode(sorted(request.args.items(multi=True)))
+        # la ruta distingue /planets de /planets/top con los mismos parametros
+        key = '{}:list:{}:{}?{}'.format(table, self.version(model), request.path, args)
+        return tuple(self.get_or_load(key, lambda: list(loader())))
+
+    def stats(self):
+        state = self.state
+        stats = {'backend': type(state.backend).__name__, 'hits': state.hits, 'misses': state.misses}
+        stats.update(state.backend.stats())
+        return stats
+
+cache = ResponseCache()
+
+def mark_changed(session, table, ids=()):
+    """Para escrituras que no pasan por el flush del ORM (bulk, query.delete)."""
+    session.info.setdefault('cache_changes', {}).setdefault(table, set()).update(ids)
+
+def changed_tables(session):
+    return set(session.info.get('cache_changes', {}))
+
+def record_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table in cache.tables:
+            mark_changed(session, table, [obj.id])
+
+def clear_changes(session):
+    # bump_versions ya subio las versiones en before_commit
+    session.info.pop('cache_changes', None)
+
+def discard_changes(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('cache_changes', None)
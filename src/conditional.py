@@ -0,0 +1,110 @@
+"""
+GET condicionales (ETag / Last-Modified) para los recursos del catalogo.
+
+Cada tabla tiene una version en `table_version` que se incrementa en la misma
+transaccion que la modifica. El ETag sale de esa version y de la URL pedida, asi
+que responder 304 cuesta una lectura por clave primaria, sin tocar las filas.
+Los GET que dependen de favorites_count suman la version de los contadores
+(counters.counts_version_name) a la de la tabla.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import g, request, make_response
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import db, Table_Version
+from cache import changed_tables, clear_changes, discard_changes
+from counters import counts_version_name, reads_favorites_count
+
+def bump_versions(session):
+    # el flush final del commit ocurre despues de before_commit, lo forzamos
+    # aqui para que sus cambios tambien cuenten
+    session.flush()
+    now = datetime.utcnow()
+    for table in sorted(changed_tables(session)):
+        bump = (update(Table_Version).where(Table_Version.table_name == table)
+                .values(version=Table_Version.version + 1, updated_at=now))
+        if session.execute(bump).rowcount == 0:
+            # primera escritura de la tabla: otro proceso puede estar creando la misma fila,
+            # asi que se inserta en 0 ignorando el conflicto y se vuelve a incrementar
+            session.execute(insert_missing_version(session, table, now))
+            session.execute(bump)
+
+def insert_missing_version(session, table, now):
+    values = {'table_name': table, 'version': 0, 'updated_at': now}
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(Table_Version).values(**values).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(Table_Version).values(**values).on_conflict_do_nothing()
+    if dialect == 'mysql':
+        return insert(Table_Version).values(**values).prefix_with('IGNORE')
+    return insert(Table_Version).values(**values)
+
+def init_versions(app=None):
+    # asgi.py lo llama sin app: sus sesiones async tambien tienen que subir las versiones
+    if not event.contains(Session, 'before_commit', bump_versions):
+        event.listen(Session, 'before_commit', bump_versions)
+        event.listen(Session, 'after_commit', clear_changes)
+        event.listen(Session, 'after_soft_rollback', discard_changes)
+
+def current_version(*tables):
+    """Version ('3' o '3.7' con varias tablas) y ultima modificacion de las filas de table_version."""
+    rows = dict((row.table_name, row) for row in db.session.execute(
+        select(Table_Version.table_name, Table_Version.version, Table_Version.updated_at)
+        .where(Table_Version.table_name.in_(tables))))
+    version = '.'.join(str(rows[table].version if table in rows else 0) for table in tables)
+    if not rows:
+        return version, None
+    last_modified = max(row.updated_at for row in rows.values()).replace(microsecond=0)
+    # Last-Modified tiene resolucion de segundos: mientras no termine el segundo de la
+    # ultima escritura, otra escritura en ese mismo segundo tendria el mismo valor y
+    # If-Modified-Since responderia 304 con datos viejos. Hasta entonces solo hay ETag.
+    if datetime.utcnow() < last_modified + timedelta(seconds=1):
+        return version, None
+    return version, last_modified.replace(tzinfo=timezone.utc)
+
+def request_version(model, counts=False):
+    """Version del modelo para este request; la comparten el ETag y las claves del cache."""
+    versions = g.setdefault('catalog_versions', {})
+    if model.__tablename__ not in versions:
+        tables = [model.__tablename__]
+        if counts or reads_favorites_count(model, request.args):
+            tables.append(counts_version_name(model))
+        versions[model.__tablename__] = current_version(*tables)
+    return versions[model.__tablename__]
+
+def not_modified(etag, last_modified):
+    # If-None-Match tiene prioridad sobre If-Modified-Since (RFC 7232)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+def conditional(model, counts=False):
+    """Decorador para GETs: añade ETag/Last-Modified y responde 304 si no cambio.
+
+    counts=True para las rutas que siempre dependen de favorites_count (/top).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # el cache arma sus claves con esta misma version (cache.version)
+            version, last_modified = request_version(model, counts)
+            url = hashlib.md5(request.full_path.encode('utf-8')).hexdigest()[:16]
+            etag = '{}-{}-{}'.format(model.__tablename__, version, url)
+            if not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
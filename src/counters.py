@@ -0,0 +1,125 @@
+"""
+Contadores de favoritos denormalizados en Planets y People.
+
+favorites_count se ajusta en la misma transaccion que crea o borra el favorito
+(endpoints individuales, bulk y ASGI), asi "los mas favoritos" es una lectura
+por indice en vez de un COUNT sobre las tablas de favoritos. Si algo escribe
+favoritos por fuera de la API, `flask reconcile-favorites` recalcula los
+contadores desde cero.
+
+Los contadores tienen su propia fila en table_version (planets:favorites_count,
+people:favorites_count): marcar un favorito no cambia el ETag ni el cache de
+/planets o /people, solo el de /top y el de los GET que piden favorites_count.
+"""
+from collections import Counter
+from sqlalchemy import delete, func, select, update
+from cache import mark_changed
+from models import User, People, Planets, Favorites_People, Favorites_Planets
+
+# tabla de favoritos -> (modelo contado, columna que apunta a el)
+FAVORITES_COUNTERS = {
+    Favorites_Planets: (Planets, 'planet_id'),
+    Favorites_People: (People, 'people_id'),
+}
+COUNTED_MODELS = tuple(entity for entity, _ in FAVORITES_COUNTERS.values())
+
+def counts_version_name(entity):
+    """Fila de table_version que versiona solo favorites_count de la entidad."""
+    return entity.__tablename__ + ':favorites_count'
+
+def reads_favorites_count(model, args):
+    """True si el GET usa favorites_count (?fields=, ?sort= o un filtro) y su respuesta depende del contador."""
+    if model not in COUNTED_MODELS:
+        return False
+    if 'favorites_count' in (field.strip() for field in args.get('fields', '').split(',')):
+        return True
+    if args.get('sort', '').lstrip('-') == 'favorites_count':
+        return True
+    return any(arg.partition('__')[0] == 'favorites_count' for arg in args)
+
+def adjust_favorites_count(session, model, entity_ids, delta):
+    """Suma delta al contador de cada id (los repetidos cuentan varias veces)."""
+    if model not in FAVORITES_COUNTERS:
+        return
+    entity, _ = FAVORITES_COUNTERS[model]
+    times = Counter(id for id in entity_ids if id is not None)
+    # un UPDATE por cada multiplicidad distinta; en la practica casi siempre uno solo
+    by_times = {}
+    for id, count in times.items():
+        by_times.setdefault(count, []).append(id)
+    for count, ids in by_times.items():
+        session.execute(update(entity).where(entity.id.in_(ids))
+                        .values(favorites_count=entity.favorites_count + delta * count)
+                        .execution_options(synchronize_session=False))
+    mark_changed(session, counts_version_name(entity), times)
+
+def favorite_entity_ids(session, model, ids):
+    """Ids de la entidad a la que apunta cada favorito, para descontar antes de borrarlo o moverlo."""
+    _, field = FAVORITES_COUNTERS[model]
+    column = getattr(model, field)
+    return dict(session.execute(select(model.id, column).where(model.id.in_(ids))).all())
+
+def count_bulk_write(session, model, inserts, updates):
+    """Ajusta contadores para filas de bulk_save; hay que llamarlo antes de escribirlas."""
+    if model not in FAVORITES_COUNTERS:
+        return
+    _, field = FAVORITES_COUNTERS[model]
+    added = [row.get(field) for row in inserts]
+    removed = []
+    moved = [row for row in updates if field in row]
+    if moved:
+        current = favorite_entity_ids(session, model, [row['id'] for row in moved])
+        for row in moved:
+            if current.get(row['id']) != row[field]:
+                removed.append(current.get(row['id']))
+                added.append(row[field])
+    adjust_favorites_count(session, model, added, 1)
+    adjust_favorites_count(session, model, removed, -1)
+
+def count_bulk_delete(session, model, ids):
+    """Descuenta los favoritos que se van a borrar; hay que llamarlo antes del DELETE."""
+    if model not in FAVORITES_COUNTERS or not ids:
+        return
+    adjust_favorites_count(session, model, favorite_entity_ids(session, model, ids).values(), -1)
+
+def delete_dependent_favorites(session, model, ids):
+    """Borra los favoritos que apuntan a usuarios, planetas o personajes que se van a borrar.
+
+    Hay que llamarlo antes del DELETE: con foreign keys activas la base no deja
+    borrar una fila con favoritos. Los de un usuario descuentan los contadores.
+    """
+    for favorites, (entity, field) in FAVORITES_COUNTERS.items():
+        if model is User:
+            column = favorites.user_id
+        elif model is entity:
+            column = getattr(favorites, field)
+        else:
+            continue
+        favorite_ids = list(session.execute(select(favorites.id).where(column.in_(list(ids)))).scalars())
+        if not favorite_ids:
+            continue
+        if model is User:
+            count_bulk_delete(session, favorites, favorite_ids)
+        session.execute(delete(favorites).where(favorites.id.in_(favorite_ids))
+                        .execution_options(synchronize_session=False))
+
+def reconcile_favorites_counts(session):
+    """Recalcula todos los contadores desde las tablas de favoritos. Devuelve filas corregidas por tabla."""
+    fixed = {}
+    for model, (entity, field) in FAVORITES_COUNTERS.items():
+        actual = (select(func.count(model.id)).where(getattr(model, field) == entity.id)
+                  .correlate(entity).scalar_subquery())
+        result = session.execute(update(entity).where(entity.favorites_count != actual)
+                                 .values(favorites_count=actual)
+                                 .execution_options(synchronize_session=False))
+        fixed[entity.__tablename__] = result.rowcount
+        if result.rowcount:
+            mark_changed(session, counts_version_name(entity))
+    return fixed
+
+def top_favorited(model, limit):
+    """Los mas favoritos primero; ORDER BY favorites_count DESC recorre el indice de la columna."""
+    fields = model.public_fields + ('favorites_count',)
+    statement = (select(*[getattr(model, field) for field in fields])
+                 .order_by(model.favorites_count.desc(), model.id).limit(limit))
+    return [dict(zip(fields, row)) for row in model.query.session.execute(statement)]
@@ -0,0 +1,33 @@
+"""
+Exportacion completa de tablas en streaming (NDJSON o array JSON).
+
+Las filas se leen por lotes con yield_per (cursor del lado del servidor en
+Postgres) y se serializan una a una, asi la memoria no crece con la tabla.
+Lo usan GET /export/<table> y el comando `flask export`.
+"""
+from serializers import dumps_row
+from models import db, User, People, Planets, Favorites_People, Favorites_Planets
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = ('ndjson', 'json')
+EXPORT_MODELS = dict((model.__tablename__, model) for model in
+                     (User, People, Planets, Favorites_People, Favorites_Planets))
+
+def iter_rows(model, batch_size=EXPORT_BATCH_SIZE):
+    fields = model.public_fields
+    query = db.session.query(*[getattr(model, field) for field in fields]).order_by(model.id)
+    for row in query.yield_per(batch_size):
+        yield dict(zip(fields, row))
+
+def iter_export(model, export_format='ndjson', batch_size=EXPORT_BATCH_SIZE):
+    """Genera el export como trozos de texto listos para escribir o enviar."""
+    if export_format == 'ndjson':
+        for row in iter_rows(model, batch_size):
+            yield dumps_row(row) + '\n'
+        return
+    yield '['
+    separator = '\n'
+    for row in iter_rows(model, batch_size):
+        yield separator + dumps_row(row)
+        separator = ',\n'
+    yield '\n]\n'
@@ -0,0 +1,225 @@
+"""
+Trabajos en segundo plano sobre una tabla de la base de datos (job).
+
+POST /jobs (o ?async=true en POST /people/bulk y /planets/bulk) guarda el
+trabajo como queued y responde 202 con su id; el cliente consulta
+GET /jobs/<id> hasta que status sea done o failed, sin dejar un worker de
+gunicorn ocupado. `flask worker` reclama los trabajos con un pool de threads o
+de procesos:
+
+    flask worker --concurrency 4
+    flask worker --concurrency 4 --processes
+    flask worker --burst            # vacia la cola y termina
+
+Tipos: bulk_import (people/planets), export (el archivo se guarda por trozos en
+la tabla job_output y se baja en streaming con GET /jobs/<id>/download desde
+cualquier proceso web) y reconcile_favorites.
+
+Mientras ejecuta un job el worker renueva heartbeat_at cada
+JOBS_HEARTBEAT_SECONDS. Solo se reencolan los jobs running sin latido en
+JOBS_STALE_SECONDS (el worker murio), nunca uno que sigue vivo aunque tarde.
+
+Con CACHE_URL=memory cada proceso tiene su propio cache: lo que escriben los
+workers aparece en la API al vencer CACHE_TTL. Con Redis se invalida al momento.
+"""
+import os
+import json
+import multiprocessing
+import socket
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from utils import APIException
+from bulk import bulk_save
+from counters import reconcile_favorites_counts
+from export import EXPORT_FORMATS, EXPORT_MODELS, iter_export
+from models import db, Job, Job_Output, People, Planets
+
+JOB_MAX_ATTEMPTS = 3
+# caracteres por fila de job_output: aun con 4 bytes por caracter entran en un TEXT de MySQL
+JOB_OUTPUT_CHUNK = 16 * 1024
+# memoria que usa el export antes de pasar a un temporal en disco
+JOB_OUTPUT_SPOOL = 1024 * 1024
+IMPORT_MODELS = {'people': People, 'planets': Planets}
+
+def validate_bulk_import(payload):
+    if payload.get('table') not in IMPORT_MODELS:
+        raise APIException('table debe ser people o planets', status_code=400)
+    if not isinstance(payload.get('items'), list):
+        raise APIException('items debe ser un array', status_code=400)
+
+def run_bulk_import(job, payload):
+    return bulk_save(IMPORT_MODELS[payload['table']], payload['items'])
+
+def validate_export(payload):
+    if payload.get('table') not in EXPORT_MODELS:
+        raise APIException('No se puede exportar {}'.format(payload.get('table')), status_code=400)
+    if payload.setdefault('format', 'ndjson') not in EXPORT_FORMATS:
+        raise APIException('format debe ser ndjson o json', status_code=400)
+
+def run_export(job, payload):
+    # primero a un temporal: mientras yield_per recorre la tabla la conexion no puede
+    # ejecutar los INSERT en todas las bases (MySQL con cursor del lado del servidor)
+    with tempfile.SpooledTemporaryFile(max_size=JOB_OUTPUT_SPOOL, mode='w+', encoding='utf-8') as spool:
+        for chunk in iter_export(EXPORT_MODELS[payload['table']], payload['format']):
+            spool.write(chunk)
+        spool.seek(0)
+        # por si un intento anterior del job llego a guardar trozos; los nuevos se confirman junto con el done
+        db.session.execute(delete(Job_Output).where(Job_Output.job_id == job.id))
+        seq = size = 0
+        data = spool.read(JOB_OUTPUT_CHUNK)
+        # siempre se guarda al menos un trozo, aunque el export este vacio
+        while seq == 0 or data:
+            db.session.execute(insert(Job_Output).values(job_id=job.id, seq=seq, data=data))
+            size += len(data.encode('utf-8'))
+            seq += 1
+            data = spool.read(JOB_OUTPUT_CHUNK)
+    return {'table': payload['table'], 'format': payload['format'], 'bytes': size}
+
+def iter_job_output(job_id):
+    """Trozos de un export guardado, en orden y sin cargarlo entero en memoria."""
+    query = (db.session.query(Job_Output.data).filter(Job_Output.job_id == job_id)
+             .order_by(Job_Output.seq))
+    for (data,) in query.yield_per(16):
+        yield data
+
+def validate_reconcile(payload):
+    pass
+
+def run_reconcile(job, payload):
+    return reconcile_favorites_counts(db.session)
+
+# tipo -> (valida el payload al encolar, lo ejecuta en el worker y devuelve el result)
+JOB_KINDS = {
+    'bulk_import': (validate_bulk_import, run_bulk_import),
+    'export': (validate_export, run_export),
+    'reconcile_favorites': (validate_reconcile, run_reconcile),
+}
+
+def init_jobs(app):
+    app.config.setdefault('JOBS_POLL_INTERVAL', float(os.getenv('JOBS_POLL_INTERVAL', 1)))
+    app.config.setdefault('JOBS_HEARTBEAT_SECONDS', float(os.getenv('JOBS_HEARTBEAT_SECONDS', 30)))
+    # un job running sin latido por mas tiempo que esto se da por perdido (worker muerto) y se reencola
+    app.config.setdefault('JOBS_STALE_SECONDS', int(os.getenv('JOBS_STALE_SECONDS', 300)))
+
+def enqueue(kind, payload):
+    if kind not in JOB_KINDS:
+        raise APIException('kind debe ser uno de: {}'.format(', '.join(sorted(JOB_KINDS))), status_code=400)
+    if not isinstance(payload, dict):
+        raise APIException('payload debe ser un objeto JSON', status_code=400)
+    JOB_KINDS[kind][0](payload)
+    job = Job(kind=kind, status='queued', payload=json.dumps(payload), created_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def claim_job(worker):
+    """Pasa a running el job queued mas viejo y lo devuelve, o None si la cola esta vacia."""
+    while True:
+        # SKIP LOCKED: en Postgres los workers no se esperan entre si (sqlite no tiene FOR UPDATE)
+        id = db.session.execute(select(Job.id).where(Job.status == 'queued').order_by(Job.id)
+                                .limit(1).with_for_update(skip_locked=True)).scalar()
+        if id is None:
+            db.session.rollback()
+            return None
+        # el UPDATE condicional asegura que un solo worker se queda con el job
+        claimed = db.session.execute(update(Job).where(Job.id == id, Job.status == 'queued')
+                                     .values(status='running', worker=worker, started_at=datetime.utcnow(),
+                                             heartbeat_at=datetime.utcnow(), attempts=Job.attempts + 1)
+                                     .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, id)
+
+def heartbeat(app, job_id, worker, stop):
+    """Renueva heartbeat_at del job cada JOBS_HEARTBEAT_SECONDS hasta que stop se active."""
+    # thread propio con su app context, y por lo tanto su propia sesion y conexion
+    with app.app_context():
+        while not stop.wait(app.config['JOBS_HEARTBEAT_SECONDS']):
+            try:
+                db.session.execute(update(Job).where(Job.id == job_id, Job.worker == worker,
+                                                     Job.status == 'running')
+                                   .values(heartbeat_at=datetime.utcnow())
+                                   .execution_options(synchronize_session=False))
+                db.session.commit()
+            except Exception:
+                # un latido perdido (p. ej. sqlite bloqueado por el job) se reintenta en el siguiente
+                db.session.rollback()
+                app.logger.warning('No se pudo renovar el heartbeat del job %s', job_id, exc_info=True)
+
+def run_job(job):
+    run = JOB_KINDS[job.kind][1]
+    stop = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(current_app._get_current_object(), job.id, job.worker, stop),
+                            daemon=True)
+    beat.start()
+    try:
+        result = run(job, json.loads(job.payload))
+    except Exception as error:
+        db.session.rollback()
+        current_app.logger.exception('Job %s (%s) fallo', job.id, job.kind)
+        job.status = 'failed'
+        job.error = str(error)
+    else:
+        job.status = 'done'
+        job.result = json.dumps(result)
+    finally:
+        stop.set()
+        beat.join()
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+def requeue_stale(stale_seconds):
+    limit = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    # started_at cubre los jobs reclamados antes de que existiera heartbeat_at
+    stale = (Job.status == 'running', func.coalesce(Job.heartbeat_at, Job.started_at) < limit)
+    db.session.execute(update(Job).where(*stale).where(Job.attempts < JOB_MAX_ATTEMPTS)
+                       .values(status='queued', worker=None).execution_options(synchronize_session=False))
+    db.session.execute(update(Job).where(*stale).where(Job.attempts >= JOB_MAX_ATTEMPTS)
+                       .values(status='failed', error='El worker no termino el job', finished_at=datetime.utcnow())
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+
+def work(app, name, stop, burst=False):
+    """Loop de un worker: reclama y ejecuta jobs hasta que stop se active (o la cola se vacie con burst)."""
+    with app.app_context():
+        requeue_stale(app.config['JOBS_STALE_SECONDS'])
+        while not stop.is_set():
+            job = claim_job(name)
+            if job is not None:
+                run_job(job)
+                continue
+            if burst:
+                return
+            stop.wait(app.config['JOBS_POLL_INTERVAL'])
+            requeue_stale(app.config['JOBS_STALE_SECONDS'])
+
+def work_in_process(name, burst):
+    # cada proceso arma su propia app y su pool de conexiones
+    from app import create_app
+    work(create_app(), name, threading.Event(), burst)
+
+def run_workers(app, concurrency, processes=False, burst=False):
+    prefix = '{}:{}'.format(socket.gethostname(), os.getpid())
+    if processes:
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=work_in_process, args=('{}:p{}'.format(prefix, i), burst))
+                   for i in range(concurrency)]
+    else:
+        stop = threading.Event()
+        workers = [threading.Thread(target=work, args=(app, '{}:t{}'.format(prefix, i), stop, burst))
+                   for i in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    try:
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(0.5)
+    except KeyboardInterrupt:
+        # los threads terminan el job en curso; los procesos reciben el Ctrl-C ellos mismos
+        if not processes:
+            stop.set()
+        for worker in workers:
+            worker.join()
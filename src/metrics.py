@@ -0,0 +1,164 @@
+"""
+Metricas por request en formato texto de Prometheus (GET /metrics).
+
+- latencia por ruta (histograma), tamaño de request y response
+- numero y tiempo total de queries SQL por request, medido con eventos del engine
+- log de queries lentas (SLOW_QUERY_MS) y aviso de N+1 cuando un request
+  lanza mas de QUERY_COUNT_WARN sentencias; ambos desactivados por defecto
+
+Los contadores viven en memoria de cada proceso: con varios workers de gunicorn
+cada uno expone los suyos.
+"""
+import os
+import threading
+import time
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+class Histogram(object):
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        # cada serie guarda [cuentas por bucket, suma, total de observaciones]
+        series = self.series.setdefault(labels, [[0] * len(self.buckets), 0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            for bound, bucket in zip(self.buckets, counts):
+                lines.append('{}_bucket{} {}'.format(self.name, format_labels(labels, le=bound), bucket))
+            lines.append('{}_bucket{} {}'.format(self.name, format_labels(labels, le='+Inf'), count))
+            lines.append('{}_sum{} {}'.format(self.name, format_labels(labels), total))
+            lines.append('{}_count{} {}'.format(self.name, format_labels(labels), count))
+        return lines
+
+LABEL_NAMES = ('method', 'route', 'status')
+
+def format_labels(labels, le=None):
+    pairs = ['{}="{}"'.format(name, value) for name, value in zip(LABEL_NAMES, labels)]
+    if le is not None:
+        pairs.append('le="{}"'.format(le))
+    return '{' + ','.join(pairs) + '}'
+
+class MetricsState(object):
+    """Series de una app; vive en app.extensions['metrics']."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = Histogram('http_request_duration_seconds', 'Latencia de cada request', LATENCY_BUCKETS)
+        self.request_size = Histogram('http_request_size_bytes', 'Tamaño del body recibido', SIZE_BUCKETS)
+        self.response_size = Histogram('http_response_size_bytes', 'Tamaño del body enviado', SIZE_BUCKETS)
+        self.queries = Histogram('db_queries_per_request', 'Sentencias SQL por request', QUERY_BUCKETS)
+        self.query_time = Histogram('db_query_duration_seconds_per_request', 'Tiempo total en SQL por request',
+                                    LATENCY_BUCKETS)
+        self.slow_queries = 0
+        self.n_plus_one_warnings = 0
+
+    def observe(self, labels, duration, request_bytes, response_bytes, queries, query_time):
+        with self.lock:
+            self.latency.observe(labels, duration)
+            self.request_size.observe(labels, request_bytes)
+            self.response_size.observe(labels, response_bytes)
+            self.queries.observe(labels, queries)
+            self.query_time.observe(labels, query_time)
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for histogram in (self.latency, self.request_size, self.response_size, self.queries, self.query_time):
+                lines.extend(histogram.render())
+            lines.extend(['# HELP db_slow_queries_total Queries por encima de SLOW_QUERY_MS',
+                          '# TYPE db_slow_queries_total counter',
+                          'db_slow_queries_total {}'.format(self.slow_queries),
+                          '# HELP db_n_plus_one_warnings_total Requests por encima de QUERY_COUNT_WARN',
+                          '# TYPE db_n_plus_one_warnings_total counter',
+                          'db_n_plus_one_warnings_total {}'.format(self.n_plus_one_warnings)])
+        return lines
+
+class Metrics(object):
+    def __init__(self):
+        # los gauges extra son codigo (leen la app actual al renderizar), no estado de una app
+        self.extra = []
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', float(os.getenv('SLOW_QUERY_MS', 0)))
+        app.config.setdefault('QUERY_COUNT_WARN', int(os.getenv('QUERY_COUNT_WARN', 0)))
+        # cada app cuenta lo suyo: un segundo create_app no mezcla ni pisa las series del primero
+        app.extensions['metrics'] = MetricsState()
+        app.before_request(start_request)
+        app.after_request(finish_request)
+        if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    @property
+    def state(self):
+        return current_app.extensions['metrics']
+
+    def add_gauges(self, name, help, collect):
+        """Registra gauges extra: collect() devuelve un dict {etiqueta: valor}."""
+        self.extra.append((name, help, collect))
+
+    def observe(self, labels, duration, request_bytes, response_bytes, queries, query_time):
+        self.state.observe(labels, duration, request_bytes, response_bytes, queries, query_time)
+
+    def render(self):
+        lines = self.state.render()
+        for name, help, collect in self.extra:
+            lines.extend(['# HELP {} {}'.format(name, help), '# TYPE {} gauge'.format(name)])
+            for key, value in sorted(collect().items()):
+                lines.append('{}{{name="{}"}} {}'.format(name, key, value))
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_time = 0.0
+
+def finish_request(response):
+    if 'metrics_start' not in g:
+        return response
+    duration = time.perf_counter() - g.metrics_start
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    labels = (request.method, route, str(response.status_code))
+    # las respuestas en streaming no tienen tamaño conocido hasta terminar
+    response_bytes = 0 if response.is_streamed else response.calculate_content_length() or 0
+    metrics.observe(labels, duration, request.content_length or 0, response_bytes,
+                    g.metrics_queries, g.metrics_query_time)
+    limit = current_app.config['QUERY_COUNT_WARN']
+    if limit and g.metrics_queries > limit:
+        metrics.state.n_plus_one_warnings += 1
+        current_app.logger.warning('Posible N+1: %s %s lanzo %d queries (limite %d)',
+                                   request.method, request.path, g.metrics_queries, limit)
+    return response
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+        g.metrics_query_time += elapsed
+    # fuera de un app context (sesiones async, scripts) no hay app a la que atribuir la query
+    if not has_app_context() or 'metrics' not in current_app.extensions:
+        return
+    slow_ms = current_app.config['SLOW_QUERY_MS']
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        metrics.state.slow_queries += 1
+        current_app.logger.warning('Query lenta (%.1f ms): %s', elapsed * 1000, statement)
@@ -1,6 +1,46 @@
+import os
+import json
+import sqlite3
+from flask import has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import cast, event, literal, null, select, union_all
+from sqlalchemy.engine import Engine
 
-db = SQLAlchemy()
+# bind de la replica de lectura (SQLALCHEMY_BINDS['read'], sale de DATABASE_READ_URL)
+READ_BIND = 'read'
+
+class RoutingSession(Session):
+    # los GET leen de la replica si esta configurada; los flush y el resto de
+    # metodos siempre van a la base principal
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and READ_BIND in self._db.engines
+                and has_request_context() and request.method in ('GET', 'HEAD')):
+            return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def engine_options(database_url):
+    """Opciones del pool desde DB_POOL_*; las usan la app Flask y el engine async de asgi.py."""
+    # pre_ping descarta conexiones muertas tras un failover
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() not in ('0', 'false', 'no'),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+    if not database_url.startswith('sqlite'):
+        # sqlite no usa QueuePool, estas opciones solo aplican a servidores reales
+        options['pool_size'] = int(os.getenv('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT', 30))
+    return options
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite no revisa las foreign keys si no se le pide; asi un favorito de un
+    # usuario o entidad inexistente falla igual que en Postgres
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
 
 class User(db.Model):
     __tablename__ = 'user'
@@ -10,6 +50,9 @@ class User(db.Model):
     password = db.Column(db.String(80), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
 
+    # columnas que se pueden devolver en la API (nunca el password)
+    public_fields = ('id', 'email', 'name')
+
     def __repr__(self):
         return '<User %r>' % self.name
 
@@ -24,9 +67,14 @@ class Planets(db.Model):
     __tablename__ = 'planets'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
-    diameter = db.Column(db.Integer)
-    rotation_period = db.Column(db.Integer)
-    
+    diameter = db.Column(db.Integer, index=True)
+    rotation_period = db.Column(db.Integer, index=True)
+    # lo mantienen los endpoints de favoritos (ver counters.py); indexado para /planets/top
+    favorites_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+
+    public_fields = ('id', 'name', 'diameter', 'rotation_period')
+    # solo se devuelven si se piden con ?fields=
+    optional_fields = ('favorites_count',)
     
   
     def __repr__(self):
@@ -43,11 +91,17 @@ class Planets(db.Model):
 class People(db.Model):
     __tablename__ = 'people'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50))
-    height = db.Column(db.Integer)
-    mass = db.Column(db.Integer)
-    hair_color = db.Column(db.String(50))
-    
+    name = db.Column(db.String(50), index=True)
+    height = db.Column(db.Integer, index=True)
+    mass = db.Column(db.Integer, index=True)
+    hair_color = db.Column(db.String(50), index=True)
+    # lo mantienen los endpoints de favoritos (ver counters.py); indexado para /people/top
+    favorites_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+
+    public_fields = ('id', 'name', 'height', 'mass', 'hair_color')
+    # solo se devuelven si se piden con ?fields=
+    optional_fields = ('favorites_count',)
+
     def __repr__(self):
         return '<People %r>' % self.name
 
@@ -62,11 +116,17 @@ class People(db.Model):
         }
 class Favorites_Planets(db.Model):
     __tablename__ = 'favorites_planets'
+    # el indice unico empieza por user_id, tambien sirve para listar favoritos de un usuario
+    __table_args__ = (db.UniqueConstraint('user_id', 'planet_id', name='uq_favorites_planets_user_planet'),)
     id = db.Column(db.Integer, primary_key=True)
     planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'))
     planets_relationship = db.relationship(Planets)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     user_relationship = db.relationship(User)
+
+    public_fields = ('id', 'planet_id', 'user_id')
+    natural_key = ('user_id', 'planet_id')
+
     def __repr__(self):
         return '<Favorites_Planets %r>' % self.id
 
@@ -78,12 +138,16 @@ class Favorites_Planets(db.Model):
         } 
 class Favorites_People(db.Model):
     __tablename__='favorites_people'
+    __table_args__ = (db.UniqueConstraint('user_id', 'people_id', name='uq_favorites_people_user_people'),)
     id = db.Column(db.Integer, primary_key=True)
     people_id = db.Column(db.Integer, db.ForeignKey('people.id'))
     people_relationship = db.relationship(People)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     user_relationship = db.relationship(User)
 
+    public_fields = ('id', 'people_id', 'user_id')
+    natural_key = ('user_id', 'people_id')
+
     def __repr__(self):
         return '<Favorites_People %r>' % self.id
 
@@ -92,4 +156,106 @@ class Favorites_People(db.Model):
             "id": self.id,
             "people_id": self.people_id,
             "user_id": self.user_id,
-        }
\ No newline at end of file
+        }
+
+# Planetas y personajes favoritos salen en una sola consulta (UNION ALL),
+# con la entidad embebida via LEFT JOIN cuando expand esta activo.
+def favorites_query(user_id, expand):
+    planet_columns = [Planets.name.label('name'), Planets.diameter.label('diameter'),
+                      Planets.rotation_period.label('rotation_period'),
+                      cast(null(), db.Integer).label('height'), cast(null(), db.Integer).label('mass'),
+                      cast(null(), db.String).label('hair_color')]
+    people_columns = [People.name.label('name'), cast(null(), db.Integer).label('diameter'),
+                      cast(null(), db.Integer).label('rotation_period'), People.height.label('height'),
+                      People.mass.label('mass'), People.hair_color.label('hair_color')]
+    planets = select(literal(0).label('kind'), Favorites_Planets.id, Favorites_Planets.user_id,
+                     Favorites_Planets.planet_id.label('entity_id'))
+    people = select(literal(1).label('kind'), Favorites_People.id, Favorites_People.user_id,
+                    Favorites_People.people_id.label('entity_id'))
+    if expand:
+        planets = planets.add_columns(*planet_columns).outerjoin(
+            Planets, Planets.id == Favorites_Planets.planet_id)
+        people = people.add_columns(*people_columns).outerjoin(
+            People, People.id == Favorites_People.people_id)
+    planets = planets.where(Favorites_Planets.user_id == user_id)
+    people = people.where(Favorites_People.user_id == user_id)
+    favorites = union_all(planets, people).subquery()
+    return select(favorites).order_by(favorites.c.kind, favorites.c.id)
+
+def serialize_favorite(row, expand):
+    if row.kind == 0:
+        favorite = {'id': row.id, 'planet_id': row.entity_id, 'user_id': row.user_id}
+        if expand:
+            favorite['planet'] = None if row.name is None else {
+                'id': row.entity_id, 'name': row.name, 'diameter': row.diameter,
+                'rotation_period': row.rotation_period}
+        return favorite
+    favorite = {'id': row.id, 'people_id': row.entity_id, 'user_id': row.user_id}
+    if expand:
+        favorite['people'] = None if row.name is None else {
+            'id': row.entity_id, 'name': row.name, 'height': row.height, 'mass': row.mass,
+            'hair_color': row.hair_color}
+    return favorite
+
+class Table_Version(db.Model):
+    # una fila por tabla del catalogo, se incrementa en cada commit que la modifica
+    __tablename__ = 'table_version'
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<Table_Version %r %r>' % (self.table_name, self.version)
+
+    def serialize(self):
+        return {
+            "table_name": self.table_name,
+            "version": self.version,
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+class Job(db.Model):
+    # cola de trabajos en segundo plano, la consume `flask worker` (ver jobs.py)
+    __tablename__ = 'job'
+    # los workers buscan el queued mas viejo: (status, id) cubre esa consulta
+    __table_args__ = (db.Index('ix_job_status_id', 'status', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    payload = db.Column(db.Text, nullable=False)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    # el worker lo renueva mientras ejecuta; sin latido reciente el job se da por perdido
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<Job %r %r>' % (self.id, self.kind)
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": json.loads(self.result) if self.result is not None else None,
+            "error": self.error,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at is not None else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at is not None else None,
+        }
+
+class Job_Output(db.Model):
+    # el archivo de un export queda en la base y no en el disco del worker, asi lo sirve
+    # cualquier proceso web; en trozos que entran en un TEXT de MySQL (64 KB)
+    __tablename__ = 'job_output'
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return '<Job_Output %r %r>' % (self.job_id, self.seq)
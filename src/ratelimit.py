@@ -0,0 +1,197 @@
+"""
+Limite de peticiones por cliente con token buckets.
+
+Cada cliente (header X-API-Key si es una de RATELIMIT_API_KEYS o, si no, su
+IP) tiene dos buckets: uno
+para lecturas (GET/HEAD/OPTIONS) y otro para escrituras. Cada ruta gasta un
+numero de tokens segun su costo (@rate_limit_cost, por defecto 1) y los buckets
+se rellenan a un ritmo constante. Si no hay tokens se responde 429 con
+Retry-After; todas las respuestas llevan los headers X-RateLimit-*.
+
+Backends: en memoria (un solo proceso) o Redis con RATELIMIT_STORAGE_URL para
+compartir los buckets entre los workers de gunicorn.
+"""
+import os
+import math
+import threading
+import time
+from flask import current_app, g, jsonify, request
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# cada cuanto MemoryBuckets descarta los buckets que ya se rellenaron
+PRUNE_INTERVAL = 60
+
+def rate_limit_cost(cost):
+    """Decorador: tokens que consume la ruta. 0 la deja fuera del limite."""
+    def decorator(view):
+        view.rate_limit_cost = cost
+        return view
+    return decorator
+
+class MemoryBuckets(object):
+    def __init__(self):
+        # key -> (tokens, ultimo acceso, momento en que vuelve a estar lleno)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.next_prune = time.monotonic() + PRUNE_INTERVAL
+
+    def take(self, key, capacity, rate, cost):
+        now = time.monotonic()
+        with self.lock:
+            if now >= self.next_prune:
+                self.prune(now)
+            tokens, last, _ = self.buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+        return allowed, tokens
+
+    def prune(self, now):
+        # un bucket lleno es igual a uno que no existe: borrarlo no cambia nada
+        # y la memoria queda acotada a los clientes de los ultimos segundos
+        self.buckets = dict((key, bucket) for key, bucket in self.buckets.items() if bucket[2] > now)
+        self.next_prune = now + PRUNE_INTERVAL
+
+# mismo algoritmo que MemoryBuckets, atomico dentro de Redis
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local last = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+class RedisBuckets(object):
+    def __init__(self, url, prefix='api-ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_STORAGE_URL apunta a Redis pero el paquete redis no esta instalado')
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, capacity, rate, cost):
+        allowed, tokens = self.script(keys=[self.prefix + key], args=[capacity, rate, time.time(), cost])
+        return bool(allowed), float(tokens)
+
+class LimiterState(object):
+    """Buckets y contadores de una app; vive en app.extensions['rate_limiter']."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.allowed = {'read': 0, 'write': 0}
+        self.rejected = {'read': 0, 'write': 0}
+        self.cost = {'read': 0, 'write': 0}
+        self.lock = threading.Lock()
+
+    def record(self, budget, allowed, cost):
+        with self.lock:
+            if allowed:
+                self.allowed[budget] += 1
+                self.cost[budget] += cost
+            else:
+                self.rejected[budget] += 1
+
+    def stats(self):
+        stats = {}
+        for budget in ('read', 'write'):
+            stats['allowed_' + budget] = self.allowed[budget]
+            stats['rejected_' + budget] = self.rejected[budget]
+            stats['cost_' + budget] = self.cost[budget]
+        return stats
+
+class RateLimiter(object):
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED',
+                              os.getenv('RATELIMIT_ENABLED', 'true').lower() not in ('0', 'false', 'no'))
+        app.config.setdefault('RATELIMIT_STORAGE_URL', os.getenv('RATELIMIT_STORAGE_URL', 'memory'))
+        # capacidad del bucket y tokens por segundo que se recuperan
+        app.config.setdefault('RATELIMIT_READ_CAPACITY', float(os.getenv('RATELIMIT_READ_CAPACITY', 300)))
+        app.config.setdefault('RATELIMIT_READ_RATE', float(os.getenv('RATELIMIT_READ_RATE', 30)))
+        app.config.setdefault('RATELIMIT_WRITE_CAPACITY', float(os.getenv('RATELIMIT_WRITE_CAPACITY', 60)))
+        app.config.setdefault('RATELIMIT_WRITE_RATE', float(os.getenv('RATELIMIT_WRITE_RATE', 5)))
+        # solo detras de un proxy de confianza se usa X-Forwarded-For
+        app.config.setdefault('RATELIMIT_TRUST_PROXY',
+                              os.getenv('RATELIMIT_TRUST_PROXY', 'false').lower() in ('1', 'true', 'yes'))
+        # solo estas claves tienen bucket propio; con cualquier otra X-API-Key se limita por IP
+        app.config.setdefault('RATELIMIT_API_KEYS', frozenset(
+            key.strip() for key in os.getenv('RATELIMIT_API_KEYS', '').split(',') if key.strip()))
+        url = app.config['RATELIMIT_STORAGE_URL']
+        if url.startswith('redis://') or url.startswith('rediss://'):
+            backend = RedisBuckets(url)
+        else:
+            backend = MemoryBuckets()
+        # cada app tiene sus buckets: un segundo create_app no toca los del primero
+        app.extensions['rate_limiter'] = LimiterState(backend)
+        app.before_request(check_rate_limit)
+        app.after_request(add_rate_limit_headers)
+
+    @property
+    def state(self):
+        return current_app.extensions['rate_limiter']
+
+    def stats(self):
+        return self.state.stats()
+
+limiter = RateLimiter()
+
+def client_key():
+    api_key = request.headers.get('X-API-Key')
+    # una clave desconocida no cuenta: si no, rotarlas daria buckets nuevos sin fin
+    if api_key and api_key in current_app.config['RATELIMIT_API_KEYS']:
+        return 'key:' + api_key
+    address = request.remote_addr
+    if current_app.config['RATELIMIT_TRUST_PROXY'] and request.access_route:
+        address = request.access_route[0]
+    return 'ip:{}'.format(address)
+
+def route_cost():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'rate_limit_cost', 1)
+
+def check_rate_limit():
+    config = current_app.config
+    if not config['RATELIMIT_ENABLED'] or request.endpoint is None:
+        return None
+    cost = route_cost()
+    if cost == 0:
+        return None
+    budget = 'read' if request.method in READ_METHODS else 'write'
+    capacity = config['RATELIMIT_{}_CAPACITY'.format(budget.upper())]
+    rate = config['RATELIMIT_{}_RATE'.format(budget.upper())]
+    # una ruta mas cara que el bucket entero nunca pasaria
+    cost = min(cost, capacity)
+    state = limiter.state
+    allowed, tokens = state.backend.take('{}:{}'.format(budget, client_key()), capacity, rate, cost)
+    state.record(budget, allowed, cost)
+    g.rate_limit = (capacity, tokens, rate)
+    if not allowed:
+        retry_after = int(math.ceil((cost - tokens) / rate))
+        response = jsonify({'message': 'Demasiadas peticiones, intenta de nuevo en {} segundos'.format(retry_after)})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    return None
+
+def add_rate_limit_headers(response):
+    state = g.get('rate_limit')
+    if state is not None:
+        capacity, tokens, rate = state
+        response.headers['X-RateLimit-Limit'] = str(int(capacity))
+        response.headers['X-RateLimit-Remaining'] = str(int(tokens))
+        # segundos hasta que el bucket vuelva a estar lleno
+        response.headers['X-RateLimit-Reset'] = str(int(math.ceil((capacity - tokens) / rate)))
+    return response
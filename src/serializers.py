@@ -0,0 +1,74 @@
+"""
+Camino rapido de serializacion.
+
+- Las lecturas seleccionan solo las columnas publicas con select() de Core y
+  arman el dict desde la tupla, sin hidratar objetos del ORM. El resultado tiene
+  las mismas claves que serialize() de cada modelo.
+- FastJSONProvider codifica las respuestas con orjson si esta instalado y si no
+  con la libreria estandar. La salida es byte a byte la misma que la de jsonify:
+  si orjson no puede reproducirla (indentado, texto no ASCII con ensure_ascii,
+  enteros enormes, floats en notacion exponencial...) se usa el encoder
+  estandar. NaN/Infinity no se detectan, pero ninguna columna de la API es float.
+"""
+import json
+import re
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPACT_SEPARATORS = (',', ':')
+EXPONENT = re.compile(rb'[0-9][eE][-+0-9]')
+# json con ensure_ascii escapa todo lo que no sea imprimible (incluido \x7f); orjson no
+NOT_PRINTABLE_ASCII = re.compile(rb'[^\x20-\x7e]')
+
+def fallback_needed(data, ensure_ascii):
+    # orjson escribe 1e20 donde json escribe 1e+20; ante la duda, encoder estandar
+    return (ensure_ascii and NOT_PRINTABLE_ASCII.search(data) is not None) or EXPONENT.search(data) is not None
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        # jsonify pide separadores compactos; cualquier otro formato va al encoder estandar
+        if orjson is None or kwargs.get('separators') != COMPACT_SEPARATORS or len(kwargs) > 1:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            data = orjson.dumps(obj, default=self.default, option=option)
+        except (TypeError, orjson.JSONEncodeError):
+            return super().dumps(obj, **kwargs)
+        if fallback_needed(data, self.ensure_ascii):
+            return super().dumps(obj, **kwargs)
+        return data.decode('utf-8')
+
+def dumps_row(row, ensure_ascii=False):
+    """JSON compacto de una fila, sin ordenar claves (export, NDJSON); igual con o sin orjson."""
+    if orjson is not None:
+        try:
+            data = orjson.dumps(row)
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+        else:
+            if not fallback_needed(data, ensure_ascii):
+                return data.decode('utf-8')
+    return json.dumps(row, separators=COMPACT_SEPARATORS, ensure_ascii=ensure_ascii)
+
+def selectable_fields(model):
+    """public_fields mas los campos opcionales (favorites_count) que se piden con ?fields=."""
+    return model.public_fields + getattr(model, 'optional_fields', ())
+
+def public_select(model):
+    return select(*[getattr(model, field) for field in model.public_fields])
+
+def row_to_dict(model, row):
+    return dict(zip(model.public_fields, row))
+
+def load_public(session, model, id):
+    """Lee una fila por id como dict con las claves de serialize() y los campos opcionales, o None."""
+    fields = selectable_fields(model)
+    row = session.execute(select(*[getattr(model, field) for field in fields]).where(model.id == id)).first()
+    return None if row is None else dict(zip(fields, row))
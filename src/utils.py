@@ -1,4 +1,15 @@
-from flask import jsonify, url_for
+import base64
+import json
+from urllib.parse import parse_qs, urlsplit
+from flask import jsonify, url_for, request
+from sqlalchemy import and_, or_, select
+from serializers import selectable_fields
+
+# tamaño de pagina por defecto y maximo para los endpoints de coleccion
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+# /planets/top y /people/top
+DEFAULT_TOP_LIMIT = 10
 
 class APIException(Exception):
     status_code = 400
@@ -15,13 +26,245 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def parse_flag(args, name, default=True):
+    value = args.get(name)
+    if value is None:
+        return default
+    return value.lower() not in ('0', 'false', 'no', 'none', '')
+
+def require_id(value, name):
+    """Los ids del body deben ser enteros (bool no cuenta, igual que bulk.check_type)."""
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise APIException('{} debe ser un numero'.format(name), status_code=400)
+    return value
+
+def parse_fields(model, args):
+    # ?fields=name,height -> solo esas columnas (en el orden de public_fields)
+    fields = args.get('fields')
+    if not fields:
+        return list(model.public_fields)
+    requested = set(field.strip() for field in fields.split(',') if field.strip())
+    unknown = requested - set(selectable_fields(model))
+    if unknown:
+        raise APIException('Campos desconocidos: {}'.format(', '.join(sorted(unknown))), status_code=400)
+    # el id siempre se devuelve porque es el cursor de la paginacion
+    requested.add('id')
+    return [field for field in selectable_fields(model) if field in requested]
+
+# ?campo__operador=valor en los endpoints de coleccion, sin operador es igualdad
+FILTER_OPERATORS = {
+    'eq': lambda column, value: column == value,
+    'ne': lambda column, value: column != value,
+    'lt': lambda column, value: column < value,
+    'lte': lambda column, value: column <= value,
+    'gt': lambda column, value: column > value,
+    'gte': lambda column, value: column >= value,
+    'startswith': lambda column, value: column.startswith(value, autoescape=True),
+    'contains': lambda column, value: column.contains(value, autoescape=True),
+    'in': lambda column, value: column.in_(value),
+}
+
+def parse_value(model, field, raw):
+    python_type = getattr(model, field).type.python_type
+    try:
+        return python_type(raw)
+    except ValueError:
+        raise APIException('Valor invalido para {}: {}'.format(field, raw), status_code=400)
+
+def parse_filters(model, args):
+    filters = []
+    for arg, raw in args.items(multi=True):
+        field, _, operator = arg.partition('__')
+        if field not in selectable_fields(model):
+            if operator:
+                raise APIException('No se puede filtrar por {}'.format(field), status_code=400)
+            # parametros que no son campos (limit, after, ...) se ignoran aqui
+            continue
+        operator = operator or 'eq'
+        if operator not in FILTER_OPERATORS:
+            raise APIException('Operador desconocido: {}'.format(operator), status_code=400)
+        if operator == 'in':
+            value = [parse_value(model, field, item) for item in raw.split(',') if item != '']
+        elif operator in ('startswith', 'contains'):
+            value = raw
+        else:
+            value = parse_value(model, field, raw)
+        filters.append(FILTER_OPERATORS[operator](getattr(model, field), value))
+    return filters
+
+def parse_sort(model, args):
+    # ?sort=-mass ordena por mass descendente; el id desempata
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    if field not in selectable_fields(model):
+        raise APIException('No se puede ordenar por {}'.format(field), status_code=400)
+    return field, descending
+
+def encode_cursor(value, id):
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, python_type):
+    """(valor, id) de un cursor compuesto; el valor debe ser del tipo de la columna de orden o null."""
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise APIException('Cursor after invalido', status_code=400)
+    if not cursor_id(id) or (value is not None and not cursor_value(value, python_type)):
+        raise APIException('Cursor after invalido', status_code=400)
+    return value, id
+
+def cursor_id(id):
+    # bool es subclase de int; fuera de 64 bits la base no puede compararlo
+    return isinstance(id, int) and not isinstance(id, bool) and -2 ** 63 <= id < 2 ** 63
+
+def cursor_value(value, python_type):
+    if python_type is int:
+        return cursor_id(value)
+    if python_type is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, python_type)
+
+def parse_page_args(args):
+    limit = args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+    if limit < 1:
+        raise APIException('limit debe ser mayor que 0', status_code=400)
+    return min(limit, MAX_PAGE_LIMIT), args.get('after')
+
+def parse_top_limit(args):
+    limit = args.get('limit', DEFAULT_TOP_LIMIT, type=int)
+    if limit < 1:
+        raise APIException('limit debe ser mayor que 0', status_code=400)
+    return min(limit, MAX_PAGE_LIMIT)
+
+def after_cursor(model, sort, descending, after):
+    if sort == 'id':
+        try:
+            after = int(after)
+        except ValueError:
+            after = None
+        if not cursor_id(after):
+            raise APIException('after debe ser un id numerico', status_code=400)
+        return model.id < after if descending else model.id > after
+    # cursor compuesto (valor, id); los NULL van siempre al final
+    column = getattr(model, sort)
+    value, id = decode_cursor(after, column.type.python_type)
+    if value is None:
+        return and_(column.is_(None), model.id > id)
+    beyond = column < value if descending else column > value
+    return or_(beyond, and_(column == value, model.id > id), column.is_(None))
+
+class KeysetPage(object):
+    """
+    Pagina por cursor: WHERE (sort, id) > after ORDER BY sort, id LIMIT n.
+    Acepta filtros (?name__startswith=, ?height__gte=...) y ?sort=-campo.
+    Solo se seleccionan las columnas pedidas, sin instanciar objetos del ORM,
+    asi que el costo por request no depende del tamaño de la tabla.
+    No ejecuta nada: statement() se corre con la sesion que toque (sync o async)
+    y las filas se pasan a items().
+    """
+    def __init__(self, model, args):
+        self.model = model
+        self.args = args
+        self.fields = parse_fields(model, args)
+        self.sort, self.descending = parse_sort(model, args)
+        self.limit, self.after = parse_page_args(args)
+        self.columns = self.fields if self.sort in self.fields else self.fields + [self.sort]
+        self.next_args = None
+
+    def statement(self):
+        model = self.model
+        statement = select(*[getattr(model, field) for field in self.columns]).where(*parse_filters(model, self.args))
+        if self.after is not None:
+            statement = statement.where(after_cursor(model, self.sort, self.descending, self.after))
+        if self.sort == 'id':
+            order = [model.id.desc() if self.descending else model.id]
+        else:
+            column = getattr(model, self.sort)
+            order = [(column.desc() if self.descending else column.asc()).nulls_last(), model.id]
+        # pedimos una fila de mas para saber si hay siguiente pagina
+        return statement.order_by(*order).limit(self.limit + 1)
+
+    def items(self, rows):
+        rows = list(rows)
+        items = [dict(zip(self.columns, row)) for row in rows[:self.limit]]
+        if len(rows) > self.limit:
+            last = items[-1]
+            self.next_args = self.args.to_dict()
+            self.next_args['after'] = last['id'] if self.sort == 'id' else encode_cursor(last[self.sort], last['id'])
+            self.next_args['limit'] = self.limit
+        if self.sort not in self.fields:
+            for item in items:
+                del item[self.sort]
+        return items
+
+def parse_ids(args):
+    # ?ids=3,1,3 -> [3, 1, 3]; se respeta el orden y las repeticiones
+    try:
+        ids = [int(id) for id in args.get('ids', '').split(',') if id.strip()]
+    except ValueError:
+        raise APIException('ids debe ser una lista de ids numericos separados por coma', status_code=400)
+    if not ids:
+        raise APIException('ids no puede estar vacio', status_code=400)
+    if len(ids) > MAX_PAGE_LIMIT:
+        raise APIException('Maximo {} ids por request'.format(MAX_PAGE_LIMIT), status_code=400)
+    return ids
+
+class IdBatch(object):
+    """
+    Lectura por lote: ?ids=1,2,3 en los endpoints de coleccion.
+    Una sola query WHERE id IN (...) con las columnas de ?fields=; los items
+    salen en el orden de ids y los que no existen como {'id': n, 'error': 'not found'}.
+    Igual que KeysetPage, statement() se corre con la sesion que toque.
+    """
+    def __init__(self, model, args):
+        self.model = model
+        self.ids = parse_ids(args)
+        self.fields = parse_fields(model, args)
+
+    def statement(self):
+        model = self.model
+        return select(*[getattr(model, field) for field in self.fields]).where(model.id.in_(set(self.ids)))
+
+    def items(self, rows):
+        found = dict((item['id'], item) for item in (dict(zip(self.fields, row)) for row in rows))
+        return [found.get(id, {'id': id, 'error': 'not found'}) for id in self.ids]
+
+def batch_load(model):
+    """Devuelve (items, None) para ?ids=, con la misma forma que keyset_paginate."""
+    batch = IdBatch(model, request.args)
+    return batch.items(model.query.session.execute(batch.statement())), None
+
+def keyset_paginate(model):
+    """Devuelve (items, next_url) para el request actual, next_url es None en la ultima pagina."""
+    page = KeysetPage(model, request.args)
+    items = page.items(model.query.session.execute(page.statement()))
+    next_url = None
+    if page.next_args is not None:
+        next_url = url_for(request.endpoint, **dict(request.view_args, **page.next_args))
+    return items, next_url
+
+def paginated_response(items, next_url):
+    response = jsonify(items)
+    if next_url is not None:
+        response.headers['Link'] = '<{}>; rel="next"'.format(next_url)
+        response.headers['X-Next-Cursor'] = parse_qs(urlsplit(next_url).query)['after'][0]
+    return response
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    # las rutas no cambian una vez que la app arranca, el HTML se arma una sola vez
+    html = app.extensions.get('sitemap')
+    if html is None:
+        html = app.extensions['sitemap'] = build_sitemap(app)
+    return html
+
+def build_sitemap(app):
+    links = ['/admin/'] if 'admin' in app.blueprints else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
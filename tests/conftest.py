@@ -0,0 +1,57 @@
+import asyncio
+import importlib
+import json
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from app import create_app
+from models import db
+
+def make_app(tmp_path, **config):
+    settings = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'primary.db'),
+        'ADMIN_ENABLED': False,
+        'CACHE_URL': 'none',
+        'RATELIMIT_ENABLED': False,
+    }
+    settings.update(config)
+    app = create_app(settings)
+    with app.app_context():
+        db.create_all(bind_key=None)
+    return app
+
+@pytest.fixture
+def app(tmp_path):
+    return make_app(tmp_path)
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def load_asgi(tmp_path, monkeypatch):
+    """Importa asgi.py de nuevo apuntando al SQLite de make_app (el engine se crea al importar)."""
+    monkeypatch.setenv('ASYNC_DATABASE_URL', 'sqlite+aiosqlite:///' + str(tmp_path / 'primary.db'))
+    monkeypatch.delitem(sys.modules, 'asgi', raising=False)
+    return importlib.import_module('asgi')
+
+def asgi_request(asgi, method, path, body=None, headers=()):
+    """Un request a la app ASGI; devuelve (status, headers, cuerpo)."""
+    async def run():
+        messages = [{'type': 'http.request', 'body': b'' if body is None else json.dumps(body).encode('utf-8')}]
+        sent = []
+        async def receive():
+            return messages.pop(0)
+        async def send(message):
+            sent.append(message)
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+                 'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]}
+        await asgi.app(scope, receive, send)
+        await asgi.engine.dispose()
+        return sent
+    start, body_message = asyncio.run(run())
+    headers = dict((name.decode('latin-1'), value.decode('latin-1')) for name, value in start['headers'])
+    return start['status'], headers, body_message['body']
@@ -0,0 +1,36 @@
+import json
+import pytest
+from conftest import asgi_request, load_asgi
+from models import db, People
+
+@pytest.fixture
+def asgi(app, tmp_path, monkeypatch):
+    with app.app_context():
+        db.session.add(People(name='han', hair_color='brown'))
+        db.session.commit()
+    return load_asgi(tmp_path, monkeypatch)
+
+def test_preflight_gets_the_same_cors_headers_as_flask(asgi, client):
+    request_headers = [('Origin', 'http://front.test'), ('Access-Control-Request-Method', 'POST'),
+                       ('Access-Control-Request-Headers', 'content-type')]
+    status, headers, body = asgi_request(asgi, 'OPTIONS', '/favorites_people/1', headers=request_headers)
+    flask = client.options('/favorites_people/1', headers=dict(request_headers))
+    assert (status, body) == (flask.status_code, b'')
+    for name in ('access-control-allow-origin', 'access-control-allow-methods', 'access-control-allow-headers',
+                 'vary'):
+        assert headers[name] == flask.headers[name], name
+    # la app ASGI no tiene el DELETE de favoritos
+    assert headers['allow'] == 'OPTIONS, POST'
+
+def test_head_answers_like_get_without_a_body(asgi):
+    get_status, get_headers, get_body = asgi_request(asgi, 'GET', '/people')
+    status, headers, body = asgi_request(asgi, 'HEAD', '/people')
+    assert (status, body) == (200, b'')
+    assert headers['content-length'] == get_headers['content-length'] == str(len(get_body))
+    assert asgi_request(asgi, 'OPTIONS', '/nowhere')[0] == 404
+
+@pytest.mark.parametrize('body', ['people_id', ['people_id'], 1])
+def test_favorite_body_must_be_an_object(asgi, body):
+    status, _, payload = asgi_request(asgi, 'POST', '/favorites_people/1', body)
+    assert status == 400
+    assert json.loads(payload) == {'message': 'El body debe ser un objeto JSON'}
@@ -0,0 +1,39 @@
+import json
+import pytest
+from models import db, User, Planets, Favorites_Planets
+
+def post_bulk(client, path, items, ndjson):
+    if ndjson:
+        body = '\n'.join(json.dumps(item) for item in items) + '\n'
+        return client.post(path, data=body, content_type='application/x-ndjson')
+    return client.post(path, json=items)
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_bad_foreign_key_only_fails_its_row(app, client, ndjson):
+    with app.app_context():
+        db.session.add(User(name='luke', email='luke@rebels.org', password='x', is_active=True))
+        db.session.add_all([Planets(name='tatooine'), Planets(name='hoth')])
+        db.session.commit()
+    items = [{'user_id': 1, 'planet_id': 1}, {'user_id': 1, 'planet_id': 999}, {'user_id': 1, 'planet_id': 2}]
+    body = post_bulk(client, '/favorites_planets/bulk', items, ndjson).get_json()
+    assert [item['index'] for item in body['inf']] == [0, 1, 2]
+    assert [item['status'] for item in body['inf']] == ['created', 'error', 'created']
+    assert body['summary'] == {'created': 2, 'error': 1}
+    with app.app_context():
+        assert sorted(row.planet_id for row in Favorites_Planets.query) == [1, 2]
+        # el contador de la fila mala se deshizo con su savepoint, el de las buenas se confirmo
+        assert [planet.favorites_count for planet in Planets.query.order_by(Planets.id)] == [1, 1]
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_duplicate_row_only_fails_its_row(app, client, ndjson):
+    with app.app_context():
+        db.session.add(Planets(name='tatooine', diameter=10465))
+        db.session.commit()
+    # planets.name es unico: la tercera fila hace fallar el chunk entero
+    items = [{'name': 'hoth'}, {'id': 1, 'diameter': 10466}, {'name': 'tatooine'}, {'name': 1}, {'name': 'naboo'}]
+    body = post_bulk(client, '/planets/bulk', items, ndjson).get_json()
+    assert [item['index'] for item in body['inf']] == [0, 1, 2, 3, 4]
+    assert [item['status'] for item in body['inf']] == ['created', 'updated', 'error', 'error', 'created']
+    with app.app_context():
+        planets = dict((planet.name, planet.diameter) for planet in Planets.query)
+    assert planets == {'tatooine': 10466, 'hoth': None, 'naboo': None}
@@ -0,0 +1,54 @@
+from models import db, People
+
+def test_escaped_query_string_does_not_share_a_cache_key(tmp_path):
+    from conftest import make_app
+    app = make_app(tmp_path, CACHE_URL='memory')
+    client = app.test_client()
+    with app.app_context():
+        db.session.add_all([People(name='han', hair_color='brown'), People(name='leia', hair_color='brown')])
+        db.session.commit()
+    assert client.get('/people?hair_color=brown%26limit%3D1').get_json() == []
+    assert len(client.get('/people?hair_color=brown&limit=1').get_json()) == 1
+
+def write_from_another_process(app, name):
+    # escribe sin pasar por este proceso (ni su cache), como otro worker: fila y version en la misma transaccion
+    from sqlalchemy import create_engine, update
+    from sqlalchemy.orm import Session
+    from models import Table_Version
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+    with Session(engine) as session:
+        session.execute(update(People).where(People.id == 1).values(name=name))
+        session.execute(update(Table_Version).where(Table_Version.table_name == 'people')
+                        .values(version=Table_Version.version + 1))
+        session.commit()
+    engine.dispose()
+
+def test_cached_bodies_follow_the_etag_version_across_processes(tmp_path):
+    from conftest import make_app
+    app = make_app(tmp_path, CACHE_URL='memory')
+    client = app.test_client()
+    assert client.post('/people', json={'name': 'han', 'height': 1, 'mass': 1, 'hair_color': 'x'}).status_code == 200
+    first = client.get('/people')
+    item = client.get('/people/1')
+    assert first.get_json()[0]['name'] == 'han'
+    write_from_another_process(app, 'solo')
+    second = client.get('/people')
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert second.get_json()[0]['name'] == 'solo'
+    assert client.get('/people/1').get_json()['inf']['name'] == 'solo'
+    assert item.headers['ETag'] != client.get('/people/1').headers['ETag']
+
+def test_each_app_keeps_its_own_cache(tmp_path):
+    from conftest import make_app
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    first = make_app(tmp_path / 'a', CACHE_URL='memory')
+    # la segunda app no debe cambiar el backend ni los contadores de la primera
+    second = make_app(tmp_path / 'b', CACHE_URL='none')
+    client = first.test_client()
+    client.get('/people')
+    client.get('/people')
+    assert client.get('/cache/stats').get_json() == {'backend': 'LRUCache', 'hits': 1, 'misses': 1,
+                                                     'size': 1, 'evictions': 0}
+    assert second.test_client().get('/cache/stats').get_json() == {'backend': 'NullCache', 'hits': 0,
+                                                                   'misses': 0, 'size': 0, 'evictions': 0}
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+from werkzeug.http import http_date
+from conditional import insert_missing_version
+from models import db, People, Table_Version
+
+def add_person(app):
+    with app.app_context():
+        db.session.add(People(name='han', hair_color='brown'))
+        db.session.commit()
+
+def age_versions(app, seconds):
+    with app.app_context():
+        db.session.execute(db.update(Table_Version).values(updated_at=datetime.utcnow() - timedelta(seconds=seconds)))
+        db.session.commit()
+
+def test_write_in_the_same_second_is_not_hidden_by_if_modified_since(app, client):
+    add_person(app)
+    assert 'Last-Modified' not in client.get('/people').headers
+    same_second = http_date(datetime.utcnow().replace(microsecond=0))
+    assert client.put('/people/1', json={'name': 'solo'}).status_code == 200
+    response = client.get('/people', headers={'If-Modified-Since': same_second})
+    assert response.status_code == 200
+    assert response.get_json()[0]['name'] == 'solo'
+
+def test_last_modified_once_its_second_is_over(app, client):
+    add_person(app)
+    age_versions(app, 5)
+    last_modified = client.get('/people').headers['Last-Modified']
+    assert client.get('/people', headers={'If-Modified-Since': last_modified}).status_code == 304
+    client.put('/people/1', json={'name': 'solo'})
+    assert client.get('/people', headers={'If-Modified-Since': last_modified}).status_code == 200
+
+def test_version_row_insert_ignores_a_concurrent_insert(app):
+    with app.app_context():
+        now = datetime.utcnow()
+        # dos procesos que escriben por primera vez la misma tabla insertan la misma fila
+        db.session.execute(insert_missing_version(db.session, 'people', now))
+        db.session.execute(insert_missing_version(db.session, 'people', now))
+        db.session.commit()
+        assert db.session.execute(db.select(Table_Version.version)).scalars().all() == [0]
@@ -0,0 +1,59 @@
+from conftest import asgi_request, load_asgi, make_app
+from models import db, User, People, Planets, Table_Version
+
+def counted_app(tmp_path):
+    app = make_app(tmp_path, CACHE_URL='memory')
+    with app.app_context():
+        db.session.add_all([User(name='luke', email='luke@rebels.org', password='x', is_active=True),
+                            User(name='leia', email='leia@rebels.org', password='x', is_active=True)])
+        for i in range(2):
+            db.session.add(Planets(name='planet{}'.format(i), diameter=1000, rotation_period=24))
+            db.session.add(People(name='person{}'.format(i), height=170, mass=70, hair_color='brown'))
+        db.session.commit()
+    return app, app.test_client()
+
+def versions(app):
+    with app.app_context():
+        return dict(db.session.execute(db.select(Table_Version.table_name, Table_Version.version)).all())
+
+def test_favorite_changes_top_but_not_the_catalogue(tmp_path):
+    app, client = counted_app(tmp_path)
+    catalogue = client.get('/planets')
+    item = client.get('/planets/2')
+    top = client.get('/planets/top')
+    counted = client.get('/planets/2?fields=favorites_count')
+    assert counted.get_json()['inf']['favorites_count'] == 0
+
+    for user_id in (1, 2):
+        assert client.post('/favorites_planets/{}'.format(user_id), json={'planet_id': 2}).status_code == 200
+
+    for old in (catalogue, item):
+        assert client.get(old.request.path, headers={'If-None-Match': old.headers['ETag']}).status_code == 304
+    assert client.get('/planets/top', headers={'If-None-Match': top.headers['ETag']}).status_code == 200
+    assert [(planet['id'], planet['favorites_count']) for planet in client.get('/planets/top').get_json()] == \
+        [(2, 2), (1, 0)]
+    fresh = client.get('/planets/2?fields=favorites_count')
+    assert fresh.headers['ETag'] != counted.headers['ETag']
+    assert fresh.get_json()['inf']['favorites_count'] == 2
+    assert versions(app) == {'user': 1, 'people': 1, 'planets': 1, 'planets:favorites_count': 2}
+
+def test_sorting_or_filtering_by_the_counter_follows_its_version(tmp_path):
+    app, client = counted_app(tmp_path)
+    urls = ['/people?sort=-favorites_count', '/people?favorites_count__gte=1', '/people?fields=name']
+    before = [client.get(url) for url in urls]
+    assert client.post('/favorites_people/1', json={'people_id': 2}).status_code == 200
+    after = [client.get(url) for url in urls]
+    assert [response.headers['ETag'] != old.headers['ETag'] for response, old in zip(after, before)] == \
+        [True, True, False]
+    assert [person['id'] for person in after[0].get_json()] == [2, 1]
+    assert [person['id'] for person in after[1].get_json()] == [2]
+
+def test_asgi_favorites_bump_the_counter_version(tmp_path, monkeypatch):
+    app, client = counted_app(tmp_path)
+    top = client.get('/planets/top')
+    asgi = load_asgi(tmp_path, monkeypatch)
+    assert asgi_request(asgi, 'POST', '/favorites_planets/1', {'planet_id': 2})[0] == 200
+    assert versions(app) == {'user': 1, 'people': 1, 'planets': 1, 'planets:favorites_count': 1}
+    fresh = client.get('/planets/top')
+    assert fresh.headers['ETag'] != top.headers['ETag']
+    assert fresh.get_json()[0]['id'] == 2
@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy import event
+from models import db, User, People, Planets, Favorites_People, Favorites_Planets
+
+def seed_favorites(app, count):
+    with app.app_context():
+        user = User(name='luke', email='luke@rebels.org', password='x', is_active=True)
+        db.session.add(user)
+        for i in range(count):
+            planet = Planets(name='planet{}'.format(i), diameter=1000 + i, rotation_period=24)
+            person = People(name='person{}'.format(i), height=170, mass=70, hair_color='brown')
+            db.session.add_all([planet, person])
+            db.session.flush()
+            db.session.add(Favorites_Planets(user_id=user.id, planet_id=planet.id))
+            db.session.add(Favorites_People(user_id=user.id, people_id=person.id))
+        db.session.commit()
+        return user.id
+
+def count_queries(app, client, url):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, statements
+
+@pytest.mark.parametrize('count', [1, 25])
+@pytest.mark.parametrize('expand', ['true', 'false'])
+def test_favorites_use_a_single_query(app, client, count, expand):
+    user_id = seed_favorites(app, count)
+    response, statements = count_queries(app, client, '/user/{}/favorites?expand={}'.format(user_id, expand))
+    assert response.status_code == 200
+    assert len(response.get_json()['inf']) == 2 * count
+    assert len(statements) == 1
+
+def test_expanded_favorites_embed_the_entity(app, client):
+    user_id = seed_favorites(app, 1)
+    favorites = client.get('/user/{}/favorites'.format(user_id)).get_json()['inf']
+    planet = next(favorite for favorite in favorites if 'planet_id' in favorite)
+    person = next(favorite for favorite in favorites if 'people_id' in favorite)
+    assert planet['planet'] == {'id': planet['planet_id'], 'name': 'planet0', 'diameter': 1000, 'rotation_period': 24}
+    assert person['people']['name'] == 'person0'
+
+@pytest.mark.parametrize('planet_id', ['abc', None, [1], True, 1.5])
+def test_favorite_entity_id_must_be_an_int(app, client, planet_id):
+    user_id = seed_favorites(app, 1)
+    response = client.post('/favorites_planets/{}'.format(user_id), json={'planet_id': planet_id})
+    assert response.status_code == 400
+    assert response.get_json() == {'message': 'planet_id debe ser un numero'}
+
+def test_favorite_for_missing_user_or_entity_is_rejected(app, client):
+    user_id = seed_favorites(app, 1)
+    assert client.post('/favorites_planets/999', json={'planet_id': 1}).status_code == 400
+    assert client.post('/favorites_people/{}'.format(user_id), json={'people_id': 999}).status_code == 400
+    assert client.post('/favorites_people/{}'.format(user_id), json={'people_id': 1, 'user_id': 'x'}).status_code == 400
+    with app.app_context():
+        assert Favorites_Planets.query.count() == 1
+        assert Favorites_People.query.count() == 1
+
+def favorite_counts(app):
+    with app.app_context():
+        return (sorted(db.session.execute(db.select(Planets.id, Planets.favorites_count)).all()),
+                db.session.query(Favorites_Planets).count(), db.session.query(Favorites_People).count())
+
+def test_deleting_a_favorited_row_deletes_its_favorites(app, client):
+    # seed_favorites escribe sin la API: sus favoritos no suman al contador
+    seed_favorites(app, 2)
+    with app.app_context():
+        other = User(name='leia', email='leia@rebels.org', password='x', is_active=True)
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+    for planet_id in (1, 2):
+        assert client.post('/favorites_planets/{}'.format(other_id), json={'planet_id': planet_id}).status_code == 200
+    assert client.delete('/planets/1').status_code == 200
+    assert client.delete('/people/1').status_code == 200
+    assert favorite_counts(app) == ([(2, 1)], 2, 1)
+    # los favoritos del usuario borrado descuentan el contador del planeta
+    assert client.delete('/user/{}'.format(other_id)).status_code == 200
+    assert favorite_counts(app) == ([(2, 0)], 1, 1)
+    assert client.delete('/planets/bulk', json=[2]).get_json()['summary'] == {'deleted': 1}
+    assert favorite_counts(app) == ([], 0, 1)
+
+@pytest.mark.parametrize('body', ['planet_id', ['planet_id', 'people_id'], 1])
+@pytest.mark.parametrize('url', ['/favorites_planets/1', '/favorites_people/1'])
+def test_favorite_body_must_be_an_object(app, client, url, body):
+    response = client.post(url, json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'message': 'El body debe ser un objeto JSON'}
@@ -0,0 +1,75 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import jobs
+from conftest import make_app
+from export import iter_export
+from jobs import requeue_stale, work
+from models import db, Job, Job_Output, People
+
+def run_queue(app):
+    work(app, 'test-worker', threading.Event(), burst=True)
+
+def test_export_is_downloaded_from_the_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_OUTPUT_CHUNK', 16)
+    app = make_app(tmp_path, RATELIMIT_ENABLED=False)
+    client = app.test_client()
+    with app.app_context():
+        db.session.add_all([People(name='han', hair_color='brown'), People(name='leia', hair_color='brown')])
+        db.session.commit()
+    job_id = client.post('/jobs', json={'kind': 'export', 'payload': {'table': 'people'}}).get_json()['inf']['id']
+    assert client.get('/jobs/{}/download'.format(job_id)).status_code == 409
+    run_queue(app)
+    response = client.get('/jobs/{}/download'.format(job_id))
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename=people.ndjson'
+    body = response.get_data(as_text=True)
+    with app.app_context():
+        assert body == ''.join(iter_export(People))
+        chunks = db.session.query(Job_Output.data).filter_by(job_id=job_id).order_by(Job_Output.seq).all()
+    assert len(chunks) > 1 and all(len(data) <= 16 for data, in chunks)
+    assert client.get('/jobs/{}'.format(job_id)).get_json()['inf']['result']['bytes'] == len(response.data)
+
+def test_empty_export_is_still_downloadable(tmp_path):
+    app = make_app(tmp_path)
+    client = app.test_client()
+    job_id = client.post('/jobs', json={'kind': 'export', 'payload': {'table': 'people'}}).get_json()['inf']['id']
+    run_queue(app)
+    response = client.get('/jobs/{}/download'.format(job_id))
+    assert (response.status_code, response.data) == (200, b'')
+
+def test_export_without_stored_output_is_gone(tmp_path):
+    app = make_app(tmp_path)
+    with app.app_context():
+        job = Job(kind='export', status='done', payload='{"table": "people", "format": "ndjson"}',
+                  created_at=datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+    assert app.test_client().get('/jobs/{}/download'.format(job_id)).status_code == 410
+
+def test_only_jobs_without_a_recent_heartbeat_are_requeued(tmp_path):
+    app = make_app(tmp_path)
+    long_ago = datetime.utcnow() - timedelta(hours=2)
+    with app.app_context():
+        alive = Job(kind='reconcile_favorites', status='running', payload='{}', attempts=1, worker='a',
+                    created_at=long_ago, started_at=long_ago, heartbeat_at=datetime.utcnow())
+        dead = Job(kind='reconcile_favorites', status='running', payload='{}', attempts=1, worker='b',
+                   created_at=long_ago, started_at=long_ago, heartbeat_at=long_ago)
+        db.session.add_all([alive, dead])
+        db.session.commit()
+        requeue_stale(300)
+        db.session.expire_all()
+        assert (alive.status, alive.worker) == ('running', 'a')
+        assert (dead.status, dead.worker) == ('queued', None)
+
+def test_running_jobs_keep_their_heartbeat_fresh(tmp_path, monkeypatch):
+    app = make_app(tmp_path, JOBS_HEARTBEAT_SECONDS=0.05)
+    monkeypatch.setitem(jobs.JOB_KINDS, 'sleep', (lambda payload: None, lambda job, payload: time.sleep(0.3)))
+    with app.app_context():
+        job_id = jobs.enqueue('sleep', {}).id
+    run_queue(app)
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        assert job.status == 'done'
+        assert job.heartbeat_at - job.started_at >= timedelta(seconds=0.2)
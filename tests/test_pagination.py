@@ -0,0 +1,50 @@
+import pytest
+from models import db, People
+from utils import encode_cursor
+
+HEIGHTS = [180, None, 150, 180, None, 170]
+
+@pytest.fixture
+def people(app):
+    with app.app_context():
+        db.session.add_all([People(name='person{}'.format(i), height=height, hair_color='brown' if i % 2 else 'black')
+                            for i, height in enumerate(HEIGHTS)])
+        db.session.commit()
+
+def walk(client, url):
+    """Sigue el Link rel=next hasta la ultima pagina y devuelve los ids en orden."""
+    ids = []
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200
+        ids.extend(item['id'] for item in response.get_json())
+        link = response.headers.get('Link')
+        url = link[1:link.index('>')] if link else None
+    return ids
+
+@pytest.mark.parametrize('url, expected', [
+    ('/people?limit=2', [1, 2, 3, 4, 5, 6]),
+    ('/people?limit=2&sort=-id', [6, 5, 4, 3, 2, 1]),
+    # los NULL van al final en los dos sentidos; el id desempata
+    ('/people?limit=2&sort=height', [3, 6, 1, 4, 2, 5]),
+    ('/people?limit=2&sort=-height', [1, 4, 6, 3, 2, 5]),
+    ('/people?limit=1&sort=-height&fields=name', [1, 4, 6, 3, 2, 5]),
+    ('/people?limit=2&sort=-height&height__gte=170', [1, 4, 6]),
+    ('/people?limit=2&sort=name&hair_color=brown', [2, 4, 6]),
+])
+def test_keyset_pages_follow_the_sort(client, people, url, expected):
+    assert walk(client, url) == expected
+
+@pytest.mark.parametrize('url', ['/people?sort=height&after=' + cursor for cursor in (
+    encode_cursor({'a': 1}, 1),
+    encode_cursor([1], 1),
+    encode_cursor(1, None),
+    encode_cursor(1, 'x'),
+    encode_cursor('tall', 1),
+    encode_cursor(1, True),
+    'not-a-cursor',
+)] + ['/people?after=abc', '/people?sort=-id&after={}'.format(2 ** 70)])
+def test_invalid_cursors_are_rejected(client, people, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert 'after' in response.get_json()['message']
@@ -0,0 +1,50 @@
+import ratelimit
+from conftest import make_app
+from ratelimit import MemoryBuckets, PRUNE_INTERVAL
+
+def limited_client(tmp_path):
+    app = make_app(tmp_path, RATELIMIT_ENABLED=True, RATELIMIT_READ_CAPACITY=4.0, RATELIMIT_READ_RATE=0.001,
+                   RATELIMIT_API_KEYS=frozenset(['partner']))
+    return app.test_client()
+
+def test_unknown_api_keys_share_the_ip_bucket(tmp_path):
+    client = limited_client(tmp_path)
+    statuses = [client.get('/people', headers={'X-API-Key': 'rotated-{}'.format(i)}).status_code
+                for i in range(3)]
+    assert statuses == [200, 200, 429]
+
+def test_configured_api_key_has_its_own_bucket(tmp_path):
+    client = limited_client(tmp_path)
+    assert [client.get('/people').status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get('/people', headers={'X-API-Key': 'partner'}).status_code == 200
+
+def test_full_buckets_are_pruned(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    buckets = MemoryBuckets()
+    for i in range(100):
+        buckets.take('read:ip:{}'.format(i), 10, 1, 1)
+    now[0] += 0.5
+    buckets.take('read:ip:busy', 10, 0.1, 10)
+    assert len(buckets.buckets) == 101
+    # los 100 se rellenan en 1 segundo; el que gasto todo tarda 10
+    now[0] += 5
+    buckets.take('read:ip:new', 10, 1, 1)
+    assert len(buckets.buckets) == 102
+    now[0] = 1000.0 + PRUNE_INTERVAL
+    buckets.take('read:ip:busy', 10, 0.1, 1)
+    assert sorted(buckets.buckets) == ['read:ip:busy']
+
+def test_each_app_keeps_its_own_buckets_and_metrics(tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    first = limited_client(tmp_path / 'a')
+    second = make_app(tmp_path / 'b', RATELIMIT_ENABLED=True, RATELIMIT_READ_CAPACITY=100.0).test_client()
+    assert [first.get('/people').status_code for _ in range(3)] == [200, 200, 429]
+    assert second.get('/people').status_code == 200
+    first_metrics = first.get('/metrics').get_data(as_text=True)
+    second_metrics = second.get('/metrics').get_data(as_text=True)
+    assert 'rate_limit{name="rejected_read"} 1' in first_metrics
+    assert 'rate_limit{name="rejected_read"} 0' in second_metrics
+    assert 'route="/people",status="429"' in first_metrics
+    assert 'route="/people",status="429"' not in second_metrics
@@ -0,0 +1,46 @@
+import shutil
+from models import db, People
+
+def make_replicated_app(tmp_path):
+    from conftest import make_app
+    app = make_app(tmp_path, CACHE_URL='memory',
+                   SQLALCHEMY_BINDS={'read': 'sqlite:///' + str(tmp_path / 'replica.db')})
+    with app.app_context():
+        db.metadata.create_all(db.engines['read'])
+    return app
+
+def names(app, engine_key):
+    with app.app_context():
+        with db.engines[engine_key].connect() as connection:
+            return [row.name for row in connection.execute(db.select(People.name))]
+
+def sync_replica(app, tmp_path):
+    # la "replicacion": se copia el archivo de la primaria sobre el de la replica
+    with app.app_context():
+        db.engines['read'].dispose()
+        shutil.copy(tmp_path / 'primary.db', tmp_path / 'replica.db')
+
+def test_writes_go_to_the_primary_and_gets_to_the_replica(tmp_path):
+    app = make_replicated_app(tmp_path)
+    client = app.test_client()
+    assert client.post('/people', json={'name': 'han', 'height': 1, 'mass': 1, 'hair_color': 'x'}).status_code == 200
+    assert names(app, None) == ['han']
+    assert names(app, 'read') == []
+    # el replica todavia no tiene la fila: el GET la lee de ahi
+    assert client.get('/people').get_json() == []
+    sync_replica(app, tmp_path)
+    assert [person['name'] for person in client.get('/people').get_json()] == ['han']
+
+def test_lagging_replica_does_not_pin_stale_cache_entries(tmp_path):
+    app = make_replicated_app(tmp_path)
+    client = app.test_client()
+    client.post('/people', json={'name': 'han', 'height': 1, 'mass': 1, 'hair_color': 'x'})
+    stale = client.get('/people')
+    # el ETag sale de la version del replica, igual que la clave del cache
+    assert stale.headers['ETag'].startswith('"people-0-')
+    assert client.get('/people/1').get_json() == {'msg': 'People not found'}
+    sync_replica(app, tmp_path)
+    fresh = client.get('/people')
+    assert fresh.headers['ETag'].startswith('"people-1-')
+    assert [person['name'] for person in fresh.get_json()] == ['han']
+    assert client.get('/people/1').get_json()['inf']['name'] == 'han'
@@ -0,0 +1,22 @@
+import json
+import pytest
+import serializers
+from serializers import COMPACT_SEPARATORS, dumps_row
+
+ROWS = [
+    {'id': 1, 'name': 'delete \x7f'},
+    {'id': 2, 'name': 'tab\tand \x1f unit separator'},
+    {'id': 3, 'name': 'Ñandú 星'},
+    {'id': 4, 'mass': 1e20},
+]
+
+@pytest.mark.parametrize('row', ROWS)
+def test_jsonify_output_matches_the_standard_encoder(app, row):
+    expected = json.dumps(row, separators=COMPACT_SEPARATORS, sort_keys=True)
+    assert app.json.dumps(row, separators=COMPACT_SEPARATORS) == expected
+
+@pytest.mark.parametrize('row', ROWS)
+def test_dumps_row_is_the_same_with_and_without_orjson(monkeypatch, row):
+    fast = dumps_row(row)
+    monkeypatch.setattr(serializers, 'orjson', None)
+    assert dumps_row(row) == fast == json.dumps(row, separators=COMPACT_SEPARATORS, ensure_ascii=False)